@@ -0,0 +1,119 @@
+# api/cache.py
+"""
+In-process response cache for the read endpoints, keyed on the ingest watermark.
+
+The watermark is ingest_stats.generation, a counter every ingest commit (and
+sweep / retention update) increments, read with the newest snapshot time at most
+every CACHE_WATERMARK_TTL seconds. Unlike a max(collected_at) it moves for rows
+that land out of timestamp order. While it holds
+still, responses come straight from memory with the JSON body and its gzip
+variant precomputed; when ingest moves it, every entry is dropped. Clients get
+ETag / Last-Modified and a 304 when their copy is current.
+"""
+import gzip, hashlib, threading, time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from os import getenv
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+CACHE_WATERMARK_TTL = float(getenv("CACHE_WATERMARK_TTL", "2"))   # seconds
+CACHE_MAX_ENTRIES   = int(getenv("CACHE_MAX_ENTRIES", "512"))
+_GZIP_MIN_BYTES     = 1024
+
+_WATERMARK_SQL = text(
+    "SELECT generation::text, last_snapshot FROM ingest_stats WHERE id = 1")
+
+class WithHeaders(NamedTuple):
+    """Return this from a build callable to cache extra response headers with the body."""
+    payload: object
+    headers: Dict[str, str]
+
+class Entry:
+    __slots__ = ("body", "gz", "etag", "last_modified", "headers")
+
+    def __init__(self, body: bytes, watermark: str, last_modified: Optional[datetime],
+                 headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.gz   = gzip.compress(body, compresslevel=6) if len(body) >= _GZIP_MIN_BYTES else None
+        self.etag = '"%s"' % hashlib.blake2b(watermark.encode() + body, digest_size=12).hexdigest()
+        self.last_modified = last_modified
+        self.headers = headers or {}
+
+class ResponseCache:
+    def __init__(self, ttl: float = CACHE_WATERMARK_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Entry] = {}
+        self._wm: Optional[Tuple[str, Optional[datetime]]] = None
+        self._checked = 0.0
+
+    async def watermark(self, db) -> Tuple[str, Optional[datetime]]:
+        """(opaque token, newest snapshot time); clears the cache when it moves."""
+        now = time.monotonic()
+        if self._wm is not None and now - self._checked < self.ttl:
+            return self._wm
+        token, last = (await db.execute(_WATERMARK_SQL)).one_or_none() or ("-", None)
+        if last is not None and last.tzinfo is None:
+            last = last.replace(tzinfo=timezone.utc)
+        wm = (f"{token}:{last.isoformat() if last else '-'}", last)
+        with self._lock:
+            if wm != self._wm:
+                self._entries.clear()
+                self._wm = wm
+            self._checked = now
+        return wm
+
+    async def get(self, key: str, db, build: Callable[[Session], object]) -> Entry:
+        """db: AsyncSession; build(session) is sync code, run via db.run_sync on a miss."""
+        token, last = await self.watermark(db)
+        e = self._entries.get(key)
+        if e is not None:
+            return e
+        out = await db.run_sync(build)
+        if isinstance(out, WithHeaders):
+            e = Entry(orjson.dumps(out.payload), token, last, out.headers)
+        else:
+            e = Entry(orjson.dumps(out), token, last)
+        with self._lock:
+            if self._wm and self._wm[0] == token:   # don't store a body from a stale watermark
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[key] = e
+        return e
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._wm = None
+
+def _not_modified(request: Request, e: Entry) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm:
+        return e.etag in {t.strip().removeprefix("W/") for t in inm.split(",")} or inm.strip() == "*"
+    ims = request.headers.get("if-modified-since")
+    if ims and e.last_modified is not None:
+        try:
+            return e.last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def respond(request: Request, e: Entry) -> Response:
+    headers = {**e.headers, "ETag": e.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if e.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(e.last_modified.astimezone(timezone.utc), usegmt=True)
+    if _not_modified(request, e):
+        return Response(status_code=304, headers=headers)
+    if e.gz is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(e.gz, media_type="application/json", headers=headers)
+    return Response(e.body, media_type="application/json", headers=headers)
+
+def cache_key(request: Request) -> str:
+    return request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
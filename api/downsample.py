@@ -0,0 +1,41 @@
+# api/downsample.py
+"""Largest-Triangle-Three-Buckets downsampling for trend series."""
+from typing import Dict, List, Sequence
+
+def lttb(points: List[Dict], threshold: int, y_keys: Sequence[str], x_key: str = "_x") -> List[Dict]:
+    """Keep `threshold` points that best preserve the shape of the first y key with data.
+
+    `points` must be sorted by `x_key` (a number, e.g. epoch seconds). Whole rows are
+    kept, so every metric in the output still lines up on the same timestamps.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+    y_key = next((k for k in y_keys if any(p.get(k) is not None for p in points)), None)
+    if y_key is None:
+        step = n / threshold
+        return [points[int(i * step)] for i in range(threshold)]
+
+    xs = [p[x_key] for p in points]
+    ys = [float(p.get(y_key) or 0.0) for p in points]
+    out = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next bucket is the third triangle corner
+        nb_lo = int((i + 1) * every) + 1
+        nb_hi = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[nb_lo:nb_hi]) / (nb_hi - nb_lo)
+        avg_y = sum(ys[nb_lo:nb_hi]) / (nb_hi - nb_lo)
+
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        best, best_area = lo, -1.0
+        ax, ay = xs[a], ys[a]
+        for j in range(lo, hi):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(points[best])
+        a = best
+    out.append(points[-1])
+    return out
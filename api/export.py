@@ -0,0 +1,159 @@
+# api/export.py
+"""
+Fleet-wide history export, streamed in columnar blocks.
+
+    /export?panorama=pano-1&days=30&resolution=hour&format=csv
+    /export?serials=0071...,0072...&since=2025-01-01T00:00:00Z&metrics=cpu_one_min,disk_root_pct
+
+Rows come off a server-side cursor EXPORT_BATCH at a time, ordered by device
+then time, and each batch is encoded and sent before the next is fetched, so
+memory stays flat however large the export is.
+
+Formats
+  json     NDJSON; one {"serial": [...], "t": [...], "<metric>": [...]} block per batch
+  csv      header + one row per point
+  arrow    Arrow IPC stream, one record batch per batch     (needs pyarrow)
+  parquet  Parquet, one row group per batch                  (needs pyarrow)
+"""
+import csv, io
+from datetime import datetime, timezone
+from os import getenv
+from typing import AsyncIterator, List, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import func, select, text
+
+from db.deadband import filled
+from db.models import Device, MetricRollup, MetricSnapshot
+from db.rollups import ROLLUP_METRICS
+from api.query import GT_FILTERS
+
+EXPORT_BATCH                = int(getenv("EXPORT_BATCH", "5000"))        # rows per fetch / block
+EXPORT_STATEMENT_TIMEOUT_MS = int(getenv("EXPORT_STATEMENT_TIMEOUT_MS", "0"))   # 0 = none
+
+FORMATS = {
+    "json": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def parse_metrics(spec: Optional[str], resolution: str, default: Sequence[str]) -> List[str]:
+    allowed = GT_FILTERS if resolution == "raw" else tuple(ROLLUP_METRICS)
+    metrics = list(dict.fromkeys(m.strip() for m in (spec or "").split(",") if m.strip())) or list(default)
+    unknown = [m for m in metrics if m not in allowed]
+    if unknown:
+        raise HTTPException(400, f"unknown metric(s) for resolution={resolution}: {', '.join(unknown)}")
+    return metrics
+
+def build_query(metrics: List[str], resolution: str, since: datetime, until: datetime,
+                serials: Optional[List[str]], panorama: Optional[List[str]]):
+    """SELECT serial, t, <metrics…> ordered by device then time."""
+    since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    until = until.astimezone(timezone.utc).replace(tzinfo=None)
+    if resolution == "raw":
+        dev_col, t_col = MetricSnapshot.device_id, MetricSnapshot.collected_at
+        q = select(dev_col, t_col, *(filled(m) for m in metrics))
+        q = q.where(t_col >= since, t_col < until)
+    else:   # rollups are stored one row per metric: pivot back to one row per bucket
+        dev_col, t_col = MetricRollup.device_id, MetricRollup.bucket
+        q = select(dev_col, t_col, *(
+            func.max(MetricRollup.avg).filter(MetricRollup.metric == m).label(m) for m in metrics))
+        q = q.where(MetricRollup.resolution == resolution, MetricRollup.metric.in_(metrics),
+                    t_col >= since, t_col < until).group_by(dev_col, t_col)
+    if serials:
+        q = q.where(dev_col.in_(serials))
+    if panorama:
+        q = q.where(dev_col.in_(select(Device.serial).where(Device.panorama.in_(panorama))))
+    return q.order_by(dev_col, t_col)
+
+def _iso(dt: datetime) -> str:
+    return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
+
+# ───────────── encoders: batch of rows → bytes ─────────────
+def _json_blocks(columns: List[str]):
+    def encode(rows: Sequence) -> bytes:
+        cols = list(zip(*rows))
+        block = {c: list(v) for c, v in zip(columns, cols)}
+        block["t"] = [_iso(t) for t in cols[1]]
+        return orjson.dumps(block) + b"\n"
+    return encode, None
+
+def _csv_rows(columns: List[str]):
+    started = False
+    def encode(rows: Sequence) -> bytes:
+        nonlocal started
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        if not started:
+            w.writerow(columns)
+            started = True
+        w.writerows((r[0], _iso(r[1]), *r[2:]) for r in rows)
+        return buf.getvalue().encode()
+    def finish() -> bytes:   # an empty export still gets its header
+        return b"" if started else (",".join(columns) + "\r\n").encode()
+    return encode, finish
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands back whatever was written since the last take()."""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+    def writable(self) -> bool:
+        return True
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+    def tell(self) -> int:
+        return self._pos
+    def take(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+def _arrow(columns: List[str], fmt: str):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(400, f"format={fmt} needs pyarrow installed on the API")
+    schema = pa.schema([("serial", pa.string()), ("t", pa.timestamp("us", tz="UTC"))]
+                       + [(m, pa.float64()) for m in columns[2:]])
+    sink = _Drain()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    else:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+        write = lambda b: writer.write_table(pa.Table.from_batches([b]))
+    def encode(rows: Sequence) -> bytes:
+        cols = list(zip(*rows))
+        write(pa.record_batch([pa.array(c, type=f.type, from_pandas=False)
+                               for c, f in zip(cols, schema)], schema=schema))
+        return sink.take()
+    def finish() -> bytes:
+        writer.close()
+        return sink.take()
+    return encode, finish
+
+def encoder(fmt: str, columns: List[str]):
+    """(encode(rows) -> bytes, finish() -> bytes | None) for `fmt`."""
+    if fmt == "json":
+        return _json_blocks(columns)
+    if fmt == "csv":
+        return _csv_rows(columns)
+    return _arrow(columns, fmt)
+
+async def stream_export(session_factory, q, encode, finish) -> AsyncIterator[bytes]:
+    """Run `q` on a server-side cursor in its own session and yield encoded batches."""
+    async with session_factory() as db:
+        # exports may legitimately run long: replace the API's read timeout for this transaction
+        await db.execute(text(f"SET LOCAL statement_timeout = {EXPORT_STATEMENT_TIMEOUT_MS}"))
+        result = await db.stream(q.execution_options(yield_per=EXPORT_BATCH))
+        async for rows in result.partitions():
+            yield encode(rows)
+    if finish:
+        tail = finish()
+        if tail:
+            yield tail
@@ -3,14 +3,26 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Dict
 from os import getenv
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from db.database import Base, engine, SessionLocal
-from db.models import Device, MetricSnapshot
+from db.async_database import AsyncSessionLocal, async_engine
+from db import deadband
+from db.models import Device, DeviceLatest, MetricRollup, MetricSnapshot
 from db.patches import ensure_columns
+from db.latest import CHANGES_CHANNEL, ensure_latest
+from db.partitions import ensure_partitions, start_maintenance
+from db.stats import ensure_stats, exact_stats, read_stats, read_sweeps
+from api.cache import ResponseCache, WithHeaders, cache_key, respond
+from api import export, query, stream
+from api.downsample import lttb
 
 app = FastAPI(
     title="PAN Metrics API",
@@ -31,18 +43,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+cache = ResponseCache()
+
 @app.on_event("startup")
 def _startup():
     # create base tables and ensure any patch columns exist
     Base.metadata.create_all(bind=engine)
     ensure_columns(engine)
+    with engine.begin() as conn:
+        ensure_partitions(conn)      # inserts need a partition before the first write
+    ensure_latest(engine)
+    ensure_stats(engine)             # one-off count for databases that predate the catalog
+    start_maintenance(engine)        # upcoming partitions + retention, every few hours
 
-def get_db():
-    db = SessionLocal()
-    try:
+@app.on_event("shutdown")
+async def _shutdown():
+    await async_engine.dispose()
+
+async def get_db():
+    # read endpoints: a connection is checked out at the first query and returned with
+    # the session; cache hits inside the watermark TTL never touch the pool
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def _to_z(dt: datetime | None) -> str | None:
     """Return an ISO-8601 string in UTC with trailing 'Z' (or None)."""
@@ -54,20 +76,39 @@ def _to_z(dt: datetime | None) -> str | None:
         dt = dt.astimezone(timezone.utc)
     return dt.isoformat().replace("+00:00", "Z")
 
-@app.get("/health")
-def health(db: Session = Depends(get_db)):
-    now = datetime.now(timezone.utc)
-    last = db.execute(select(func.max(MetricSnapshot.collected_at))).scalar()
-    device_count = db.execute(select(func.count(Device.serial))).scalar() or 0
-    snap_count = db.execute(select(func.count(MetricSnapshot.id))).scalar() or 0
+def _health_stats(db: Session, exact: bool = False) -> Dict:
+    """Counts from the ingest_stats catalog; exact=True recounts the tables instead."""
+    if exact:
+        st, source = exact_stats(db), "postgres"
+    else:
+        st, source = read_stats(db) or {}, "catalog"
     return {
-        "api_time": _to_z(now),
-        "last_snapshot": _to_z(last),
-        "devices": device_count,
-        "rows": snap_count,
-        "source": "postgres",
+        "last_snapshot": _to_z(st.get("last_snapshot")),
+        "devices": st.get("device_count") or 0,
+        "rows": st.get("snapshot_rows") or 0,
+        "source": source,
+        "stats_updated": _to_z(st.get("updated_at")),
+        "sweeps": [
+            {**sw, "started_at": _to_z(sw["started_at"])} for sw in read_sweeps(db)
+        ],
     }
 
+@app.get("/health")
+async def health(request: Request, exact: bool = Query(False, description="count the tables instead of reading the catalog"),
+                 db: AsyncSession = Depends(get_db)):
+    now = datetime.now(timezone.utc)
+    if exact:
+        return {"api_time": _to_z(now), **await db.run_sync(_health_stats, exact=True)}
+    e = await cache.get("/health", db, _health_stats)
+    resp = respond(request, e)
+    if resp.status_code == 304:
+        return resp
+    # api_time is per call; the (cached) stats part drives the ETag
+    body = {"api_time": _to_z(now), **orjson.loads(e.body)}
+    return Response(orjson.dumps(body), media_type="application/json",
+                    headers={k: v for k, v in resp.headers.items()
+                             if k.lower() in ("etag", "last-modified", "cache-control")})
+
 def _pack(dev: Device, s: MetricSnapshot) -> Dict:
     out: Dict = {
         "hostname": dev.hostname,
@@ -116,43 +157,164 @@ def _pack(dev: Device, s: MetricSnapshot) -> Dict:
 
     return out
 
-@app.get("/devices")
-def list_devices(db: Session = Depends(get_db)) -> List[Dict]:
-    latest = (
-        select(
-            MetricSnapshot.device_id,
-            func.max(MetricSnapshot.collected_at).label("last_ts"),
-        )
-        .group_by(MetricSnapshot.device_id)
-        .subquery()
-    )
-    q = (
-        select(Device, MetricSnapshot)
-        .join(latest, latest.c.device_id == Device.serial)
+def _latest_join(q):
+    """Join Device → device_latest → its snapshot (one row per device, no history scan)."""
+    return (
+        q.join(DeviceLatest, DeviceLatest.device_id == Device.serial)
         .join(
             MetricSnapshot,
-            (MetricSnapshot.device_id == latest.c.device_id)
-            & (MetricSnapshot.collected_at == latest.c.last_ts),
+            (MetricSnapshot.id == DeviceLatest.snapshot_id)
+            & (MetricSnapshot.collected_at == DeviceLatest.collected_at),
         )
-        .order_by(Device.hostname)
     )
+
+def _list_devices(db: Session, request: Request, fields: List[str] | None = None,
+                  limit: int | None = None, cursor: str | None = None,
+                  cert_days: int | None = None):
+    if fields:   # select only the requested columns, plus the keyset
+        q = select(*(query.column(f) for f in fields), Device.hostname, Device.serial)
+        q = _latest_join(q.select_from(Device))
+    else:
+        q = _latest_join(select(Device, MetricSnapshot))
+    q = query.apply_filters(q, request.query_params, cert_days)
+    q = query.apply_cursor(q, cursor)
+    if limit is not None:
+        q = q.limit(limit + 1)
     rows = db.execute(q).all()
-    return [_pack(d, s) for d, s in rows]
+    more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if more else rows
+    if not fields:
+        deadband.fill_masked(db, [s for _, s in rows])
+    items = query.projected(fields, rows, _to_z) if fields else [_pack(d, s) for d, s in rows]
+    if not more:
+        return items
+    last = rows[-1]
+    nxt = query.encode_cursor(*(last[-2:] if fields else (last[0].hostname, last[0].serial)))
+    return WithHeaders(items, {
+        "X-Next-Cursor": nxt,
+        "Link": f'<{request.url.include_query_params(cursor=nxt)}>; rel="next"',
+    })
+
+@app.get("/devices")
+async def list_devices(
+    request: Request,
+    fields: str | None = Query(None, description="comma-separated keys to return"),
+    limit: int | None = Query(None, ge=1, le=5000, description="page size; omit for every device"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    cert_expires_within_days: int | None = Query(None, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """Latest row per device, ordered by hostname. Also filters on panorama, ha_state,
+    connected, model, pan_os_version, logging_service (comma = any of) and
+    <numeric field>_gt, e.g. cpu_one_min_gt=80 or disk_root_pct_gt=90."""
+    cols = query.parse_fields(fields)
+    return respond(request, await cache.get(cache_key(request), db, lambda s: _list_devices(
+        s, request, cols, limit, cursor, cert_expires_within_days)))
+
+def _changes(db: Session, since: int) -> Dict:
+    """Devices whose latest snapshot moved after `since` (a device_latest.seq watermark)."""
+    rows = db.execute(
+        _latest_join(select(Device, MetricSnapshot, DeviceLatest.seq))
+        .where(DeviceLatest.seq > since)
+        .order_by(DeviceLatest.seq)
+    ).all()
+    deadband.fill_masked(db, [s for _, s, _ in rows])
+    return {
+        "watermark": rows[-1][2] if rows else since,
+        "devices": [_pack(d, s) for d, s, _ in rows],
+    }
+
+@app.get("/devices/changes")
+async def device_changes(request: Request, since: int = Query(0, ge=0), db: AsyncSession = Depends(get_db)):
+    """Delta feed: pass the returned `watermark` back as `since` next time (0 = everything)."""
+    return respond(request, await cache.get(cache_key(request), db, lambda s: _changes(s, since)))
+
+def _hub_fetch(since: int):
+    with SessionLocal() as db:
+        out = _changes(db, since)
+    return out["watermark"], out["devices"]
+
+def _hub_head() -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.coalesce(func.max(DeviceLatest.seq), 0))).scalar()
+
+hub = stream.Hub(
+    _hub_fetch, _hub_head,
+    engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    if engine.url.get_backend_name() == "postgresql" else None,
+    CHANGES_CHANNEL,
+)
+
+@app.get("/devices/stream")
+async def device_stream(request: Request, since: int | None = Query(None, ge=0)):
+    """SSE: a `changes` event ({watermark, devices}) whenever ingest commits.
+    With `since` (or Last-Event-ID on reconnect) the first event catches up from there."""
+    last_id = request.headers.get("last-event-id", "")
+    if last_id.isdigit():
+        since = int(last_id)
+    await run_in_threadpool(hub.start)
+    q = hub.subscribe()
+    catch_up = None
+    try:
+        if since is not None:
+            wm, devices = await run_in_threadpool(_hub_fetch, since)
+            catch_up = stream.sse(wm, devices) if devices else None
+            since = wm
+    except Exception:
+        hub.unsubscribe(q)
+        raise
+    return StreamingResponse(
+        stream.events(hub, q, since or 0, catch_up),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},   # no proxy buffering
+    )
+
+@app.get("/export")
+async def export_history(
+    serials: str | None = Query(None, description="comma-separated serials"),
+    panorama: str | None = Query(None, description="comma-separated Panorama names"),
+    since: datetime | None = Query(None, description="ISO-8601; default now - days"),
+    until: datetime | None = Query(None, description="ISO-8601; default now"),
+    days: int = Query(7, ge=1, le=3660),
+    metrics: str | None = Query(None, description="comma-separated; default cpu, memory, sessions"),
+    resolution: str = Query("raw", pattern="^(raw|hour|day)$"),
+    format: str = Query("json", pattern="^(json|csv|arrow|parquet)$"),
+):
+    """History for many devices in one streamed response (see api/export.py for the formats)."""
+    until = until or datetime.now(timezone.utc)
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    since = since or until - timedelta(days=days)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if since >= until:
+        raise HTTPException(400, "since must be before until")
+    cols = export.parse_metrics(metrics, resolution, _TREND_METRICS)
+    split = lambda v: [x for x in (v or "").split(",") if x] or None
+    q = export.build_query(cols, resolution, since, until, split(serials), split(panorama))
+    encode, finish = export.encoder(format, ["serial", "t", *cols])
+    ext = {"json": "ndjson"}.get(format, format)
+    return StreamingResponse(
+        export.stream_export(AsyncSessionLocal, q, encode, finish),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="pan-metrics-{resolution}.{ext}"'},
+    )
 
 @app.get("/devices/{serial}")
-def device_detail(serial: str, db: Session = Depends(get_db)) -> Dict:
+async def device_detail(serial: str, request: Request, db: AsyncSession = Depends(get_db)):
+    return respond(request, await cache.get(cache_key(request), db, lambda s: _device_detail(serial, s)))
+
+def _device_detail(serial: str, db: Session) -> Dict:
     dev = db.get(Device, serial)
     if not dev:
         raise HTTPException(404, f"{serial} not found")
-    snap = (
-        db.query(MetricSnapshot)
-        .filter(MetricSnapshot.device_id == serial)
-        .order_by(MetricSnapshot.collected_at.desc())
-        .limit(1)
-        .one_or_none()
-    )
+    snap = db.execute(
+        _latest_join(select(MetricSnapshot).select_from(Device))
+        .where(Device.serial == serial)
+    ).scalar_one_or_none()
     if not snap:
         raise HTTPException(404, f"No snapshots for {serial}")
+    deadband.fill_masked(db, [snap])
     return {
         "device": {
             "hostname": dev.hostname,
@@ -165,30 +327,76 @@ def device_detail(serial: str, db: Session = Depends(get_db)) -> Dict:
         "latest": _pack(dev, snap),
     }
 
-@app.get("/devices/{serial}/trend")
-def device_trend(
-    serial: str,
-    days: int = Query(7, ge=1, le=90),
-    db: Session = Depends(get_db),
-):
-    since = datetime.now(timezone.utc) - timedelta(days=days)
-    rows = (
-        db.query(
+_TREND_METRICS = ("cpu_one_min", "memory_usage", "session_count")
+
+async def _raw_trend(db: AsyncSession, serial: str, since: datetime) -> List[Dict]:
+    rows = (await db.execute(
+        select(
             MetricSnapshot.collected_at,
-            MetricSnapshot.cpu_one_min,
-            MetricSnapshot.memory_usage,
-            MetricSnapshot.session_count,
+            *(deadband.filled(m) for m in _TREND_METRICS),
         )
-        .filter(MetricSnapshot.device_id == serial, MetricSnapshot.collected_at >= since)
+        .where(MetricSnapshot.device_id == serial, MetricSnapshot.collected_at >= since)
         .order_by(MetricSnapshot.collected_at.asc())
-        .all()
-    )
+    )).all()
     return [
         {
             "t": _to_z(r[0]),
             "cpu_one_min": r[1],
             "memory_usage": r[2],
             "session_count": r[3],
+            "_x": r[0].timestamp(),
         }
         for r in rows
     ]
+
+async def _rollup_trend(db: AsyncSession, serial: str, resolution: str, since: datetime) -> List[Dict]:
+    """One point per bucket: avg under the usual key, plus <metric>_min/_max/_p95."""
+    since = since.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        since = since.replace(hour=0)
+    rows = (await db.execute(
+        select(MetricRollup.bucket, MetricRollup.metric, MetricRollup.avg,
+               MetricRollup.min, MetricRollup.max, MetricRollup.p95)
+        .where(
+            MetricRollup.device_id == serial,
+            MetricRollup.resolution == resolution,
+            MetricRollup.bucket >= since,
+            MetricRollup.metric.in_(_TREND_METRICS),
+        )
+        .order_by(MetricRollup.bucket.asc())
+    )).all()
+    points: Dict[datetime, Dict] = {}
+    for bucket, metric, avg, lo, hi, p95 in rows:
+        p = points.get(bucket)
+        if p is None:
+            p = points[bucket] = {"t": _to_z(bucket), **dict.fromkeys(_TREND_METRICS),
+                                  "_x": bucket.timestamp()}
+        p[metric] = avg
+        p[f"{metric}_min"], p[f"{metric}_max"], p[f"{metric}_p95"] = lo, hi, p95
+    return list(points.values())
+
+@app.get("/devices/{serial}/trend")
+async def device_trend(
+    serial: str,
+    days: int = Query(7, ge=1, le=90),
+    resolution: str = Query("auto", pattern="^(auto|raw|hour|day)$"),
+    max_points: int = Query(2000, ge=10, le=20000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Trend for one device. `auto` picks raw (≤2 days), hourly (≤30) or daily rollups,
+    falling back to raw when the rollups have nothing for the window (not backfilled yet);
+    anything still longer than `max_points` is LTTB-downsampled."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    auto = resolution == "auto"
+    if auto:
+        resolution = "raw" if days <= 2 else "hour" if days <= 30 else "day"
+    if resolution == "raw":
+        points = await _raw_trend(db, serial, since)
+    else:
+        points = await _rollup_trend(db, serial, resolution, since)
+        if not points and auto:
+            points = await _raw_trend(db, serial, since)
+    points = lttb(points, max_points, _TREND_METRICS)
+    for p in points:
+        del p["_x"]
+    return points
@@ -0,0 +1,117 @@
+# api/query.py
+"""
+/devices query options: keyset pagination, field projection and filters.
+
+    /devices?limit=200                            first page; X-Next-Cursor / Link for the next
+    /devices?limit=200&cursor=<X-Next-Cursor>
+    /devices?fields=hostname,serial,cpu_one_min   only these columns are selected
+    /devices?panorama=pano-1,pano-2&ha_state=active
+    /devices?cpu_one_min_gt=80&disk_root_pct_gt=90
+    /devices?cert_expires_within_days=30
+    /devices?fields=serial,disk_opt_foo_pct&disk_opt_foo_pct_gt=90   keys stored in extras
+
+Names that aren't columns are looked up in the snapshot's JSONB extras.
+
+Rows are ordered by (hostname, serial) and the cursor is the last row's key, so
+every page is an index range scan on devices, however deep it is. Filters run
+on the device_latest join, i.e. on one snapshot per device, against the plain
+snapshot columns; only with deadband reads on (db/deadband.py) do they go
+through the change-log CASE.
+"""
+import base64, re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+
+from db.deadband import filled
+from db.models import Device, MetricSnapshot
+
+# every key _pack() emits from a table column → that column
+FIELDS = {
+    "hostname": Device.hostname,
+    "serial": Device.serial,
+    "ip": Device.ip,
+    "panorama": Device.panorama,
+    "pan_os_version": Device.pan_os_version,
+    "model": Device.model,
+    # snapshot columns: the plain column (indexable, keyset-friendly) unless deadband
+    # reads are on (DEADBAND_READS), then read through the change log
+    **{c: filled(c) for c in (
+        "connected", "ha_state", "cpu_one_min", "memory_usage", "swap_used",
+        "session_count", "session_max", "logging_service", "device_certificate", "device_cert_exp",
+        "disk_root_pct", "disk_dev_pct", "disk_opt_pancfg_pct", "disk_opt_panrepo_pct",
+        "disk_dev_shm_pct", "disk_cgroup_pct", "disk_opt_panlogs_pct",
+        "disk_opt_pancfg_mgmt_ssl_private_pct", "disk_opt_panraid_ld1_pct")},
+    "timestamp": MetricSnapshot.collected_at,
+}
+
+# ?<name>=a,b  → IN (a, b)
+EQ_FILTERS = ("panorama", "ha_state", "connected", "model", "pan_os_version", "logging_service")
+# ?<name>_gt=x → name > x
+GT_FILTERS = tuple(k for k in FIELDS if k in ("cpu_one_min", "memory_usage", "swap_used",
+                                               "session_count", "session_max") or k.startswith("disk_"))
+
+_EXTRAS_KEY_RE = re.compile(r"[A-Za-z0-9_]+")
+
+def column(name: str):
+    """FIELDS[name], else the value of `name` in extras (JSON → Python as-is)."""
+    if name in FIELDS:
+        return FIELDS[name]
+    if not _EXTRAS_KEY_RE.fullmatch(name):
+        raise HTTPException(400, f"bad field name: {name!r}")
+    return MetricSnapshot.extras[name].label(name)
+
+def parse_fields(spec: Optional[str]) -> Optional[List[str]]:
+    if not spec:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    for f in fields:
+        column(f)
+    return fields
+
+def apply_filters(q, params, cert_expires_within_days: Optional[int] = None):
+    """Add WHERE clauses for the EQ_FILTERS / <metric>_gt params present in `params`."""
+    for name in EQ_FILTERS:
+        if params.get(name):
+            q = q.where(FIELDS[name].in_([v for v in params[name].split(",") if v]))
+    for key, raw in params.items():
+        if not key.endswith("_gt"):
+            continue
+        name = key[:-3]
+        try:
+            x = float(raw)
+        except ValueError:
+            raise HTTPException(400, f"{key} must be a number")
+        if name in GT_FILTERS:
+            q = q.where(FIELDS[name] > x)
+        elif name in FIELDS:
+            raise HTTPException(400, f"can't filter on {key}; numeric fields: {', '.join(GT_FILTERS)}")
+        else:   # extras: jsonb > jsonb compares numbers numerically (and can use ix_snap_extras_<key>)
+            val = column(name)
+            q = q.where(func.jsonb_typeof(val) == "number", val > func.to_jsonb(x).cast(JSONB))
+    if cert_expires_within_days is not None:
+        until = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=cert_expires_within_days)
+        exp = FIELDS["device_cert_exp"]
+        q = q.where(exp.is_not(None), exp <= until)
+    return q
+
+def encode_cursor(hostname: str, serial: str) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([hostname, serial])).decode().rstrip("=")
+
+def apply_cursor(q, cursor: Optional[str]):
+    """Rows after the cursor's (hostname, serial), in keyset order."""
+    if cursor:
+        try:
+            hostname, serial = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except Exception:
+            raise HTTPException(400, "invalid cursor")
+        q = q.where(tuple_(Device.hostname, Device.serial) > tuple_(hostname, serial))
+    return q.order_by(Device.hostname, Device.serial)
+
+def projected(fields: List[str], rows, to_z) -> List[Dict]:
+    """rows: the selected FIELDS columns in `fields` order (extra trailing columns are ignored)."""
+    return [{f: to_z(v) if isinstance(v, datetime) else v for f, v in zip(fields, r)} for r in rows]
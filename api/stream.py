@@ -0,0 +1,140 @@
+# api/stream.py
+"""
+Push device deltas to every open dashboard over Server-Sent Events.
+
+One background thread LISTENs on the channel ingest NOTIFYs after each batch
+(db.latest.CHANGES_CHANNEL), falling back to polling every STREAM_POLL_SECS if
+LISTEN isn't available. On each wake-up it runs a single delta query past its
+watermark, serializes the result once and hands the same bytes to every
+subscriber, so N clients cost one query, not N.
+
+A client that falls STREAM_QUEUE_MAX events behind is dropped; EventSource
+reconnects with Last-Event-ID and catches up from /devices/changes.
+"""
+import asyncio, select, threading
+from os import getenv
+from typing import Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+STREAM_POLL_SECS  = float(getenv("STREAM_POLL_SECS", "5"))
+STREAM_HEARTBEAT  = float(getenv("STREAM_HEARTBEAT_SECS", "15"))
+STREAM_QUEUE_MAX  = int(getenv("STREAM_QUEUE_MAX", "32"))
+
+# fetch(since) -> (watermark, devices changed after `since`); head() -> current watermark
+Fetch = Callable[[int], Tuple[int, List[Dict]]]
+
+def sse(watermark: int, devices: List[Dict]) -> bytes:
+    data = orjson.dumps({"watermark": watermark, "devices": devices})
+    return b"id: %d\nevent: changes\ndata: %s\n\n" % (watermark, data)
+
+class Hub:
+    def __init__(self, fetch: Fetch, head: Callable[[], int], dsn: Optional[str], channel: str):
+        self.fetch   = fetch
+        self.head    = head
+        self.dsn     = dsn
+        self.channel = channel
+        self.watermark: Optional[int] = None
+        self._subs: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock   = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Pin the starting watermark and start the thread; the first client calls this."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.watermark = self.head()
+            self._thread = threading.Thread(target=self._run, name="device-stream", daemon=True)
+            self._thread.start()
+
+    # ── subscribers (event loop side) ──
+    def subscribe(self) -> asyncio.Queue:
+        """Call after start() and before the client's catch-up query, so nothing falls between."""
+        q: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_MAX)
+        with self._lock:
+            self._subs[q] = asyncio.get_running_loop()
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        with self._lock:
+            self._subs.pop(q, None)
+
+    @staticmethod
+    def _offer(q: asyncio.Queue, item) -> None:
+        try:
+            q.put_nowait(item)
+        except asyncio.QueueFull:                   # too slow: disconnect, it will catch up
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(None)
+
+    def _broadcast(self, item: Tuple[int, bytes]) -> None:
+        with self._lock:
+            subs = list(self._subs.items())
+        for q, loop in subs:
+            loop.call_soon_threadsafe(self._offer, q, item)
+
+    # ── background thread ──
+    def _listen(self):
+        """A LISTENing psycopg connection, or None to poll."""
+        if not self.dsn:
+            return None
+        try:
+            import psycopg
+            conn = psycopg.connect(self.dsn, autocommit=True)
+            conn.execute(f"LISTEN {self.channel}")
+            return conn
+        except Exception as e:
+            print(f"[stream] LISTEN unavailable, polling every {STREAM_POLL_SECS}s – {e}")
+            return None
+
+    def _wait(self, conn) -> object:
+        """Block until a NOTIFY arrives or the poll interval runs out; returns the connection to keep."""
+        if conn is None:
+            threading.Event().wait(STREAM_POLL_SECS)
+            return None
+        try:
+            if select.select([conn.fileno()], [], [], STREAM_POLL_SECS)[0]:
+                conn.execute("SELECT 1")            # drains the pending notifications
+            return conn
+        except Exception as e:
+            print(f"[stream] listener lost – {e}")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return self._listen()
+
+    def _run(self) -> None:
+        conn = self._listen()
+        while True:
+            try:
+                wm, devices = self.fetch(self.watermark)
+                if devices:
+                    self._broadcast((wm, sse(wm, devices)))
+                    self.watermark = wm
+            except Exception as e:
+                print(f"[stream] delta query failed – {e}")
+            conn = self._wait(conn)
+
+async def events(hub: Hub, q: asyncio.Queue, since: int, catch_up: Optional[bytes]):
+    """SSE byte stream for one client: catch-up, then shared deltas and heartbeats."""
+    try:
+        yield b"retry: 3000\n\n"
+        if catch_up:
+            yield catch_up
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if item is None:
+                return
+            wm, body = item
+            if wm > since:                          # already covered by the catch-up
+                since = wm
+                yield body
+    finally:
+        hub.unsubscribe(q)
@@ -0,0 +1,95 @@
+# bench/parsers.py
+"""
+Parser benchmark + regression gate
+
+Runs every p_* parser over the recorded PAN-OS responses in bench/fixtures
+(<command label>[-variant].xml), plus _normalize_cert_ts and db_write._parse_dt
+over fixtures/timestamps.txt, and reports parses per second.
+
+Before timing, every output is compared with fixtures/expected.json: a parser
+change must give byte-identical results. With --baseline the throughput is also
+compared with a saved run and anything slower than --tolerance fails:
+
+    python -m bench.parsers --save-baseline /tmp/parsers.json    # on main
+    python -m bench.parsers --baseline /tmp/parsers.json         # on your branch
+
+--record rewrites expected.json; only use it when a parser is meant to change output.
+"""
+import argparse, json, sys, time
+from pathlib import Path
+
+from collector import metrics_collector as mc
+from collector.db_write import _parse_dt
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+EXPECTED = FIXTURES / "expected.json"
+
+def _cases() -> dict:
+    """name -> (function, inputs)."""
+    labels = sorted(mc._COMMANDS, key=lambda c: -len(c[0]))
+    cases = {}
+    for f in sorted(FIXTURES.glob("*.xml")):
+        cmd = next((c for c in labels if f.stem == c[0] or f.stem.startswith(c[0] + "-")), None)
+        if cmd is None:
+            raise SystemExit(f"[bench] {f.name}: no command label matches")
+        cases[f.stem] = (cmd[2], [f.read_text()])
+    stamps = (FIXTURES / "timestamps.txt").read_text().split("\n")[:-1]
+    cases["_normalize_cert_ts"] = (mc._normalize_cert_ts, stamps)
+    cases["_parse_dt"] = (lambda s: (d := _parse_dt(s)) and d.isoformat(), stamps)
+    return cases
+
+def _outputs(fn, inputs) -> str:
+    return json.dumps([fn(x) for x in inputs])
+
+def _rate(fn, inputs, min_secs: float, repeat: int = 5) -> float:
+    """Parses per second: best of `repeat` rounds, together at least `min_secs`."""
+    best = 0.0
+    for _ in range(repeat):
+        n, t0 = 0, time.perf_counter()
+        while True:
+            for x in inputs:
+                fn(x)
+            n += len(inputs)
+            dt = time.perf_counter() - t0
+            if dt >= min_secs / repeat:
+                break
+        best = max(best, n / dt)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark and regression-check the collector parsers.")
+    ap.add_argument("--record", action="store_true", help="rewrite fixtures/expected.json")
+    ap.add_argument("--secs", type=float, default=0.5, help="minimum timing per case")
+    ap.add_argument("--baseline", type=Path, help="fail if slower than this saved run")
+    ap.add_argument("--save-baseline", type=Path, help="store this run's throughput")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown vs baseline")
+    args = ap.parse_args()
+
+    cases = _cases()
+    got = {name: _outputs(fn, inputs) for name, (fn, inputs) in cases.items()}
+    if args.record:
+        EXPECTED.write_text(json.dumps({k: json.loads(v) for k, v in got.items()}, indent=1) + "\n")
+        print(f"[bench] recorded {len(got)} cases → {EXPECTED}")
+        return
+
+    expected = {k: json.dumps(v) for k, v in json.loads(EXPECTED.read_text()).items()}
+    failed = [k for k in cases if got[k] != expected.get(k)]
+    for k in failed:
+        print(f"[bench] {k}: output changed\n  expected {expected.get(k)}\n  got      {got[k]}")
+
+    base = json.loads(args.baseline.read_text()) if args.baseline else {}
+    rates = {}
+    print(f"{'case':<24}{'parses/s':>14}{'vs base':>10}")
+    for name, (fn, inputs) in cases.items():
+        rates[name] = r = _rate(fn, inputs, args.secs)
+        rel = f"{r / base[name]:>9.2f}x" if name in base else ""
+        print(f"{name:<24}{r:>14,.0f}{rel}")
+        if name in base and r < base[name] * (1 - args.tolerance):
+            failed.append(name)
+            print(f"[bench] {name}: slower than baseline")
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(rates, indent=1) + "\n")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# bench/simulator.py
+"""
+Local PAN-OS XML API simulator
+
+One HTTPS server stands in for Panoramas and a whole fleet of firewalls. It
+answers what the collector sends: type=keygen, `show devices connected` and
+the six op commands in metrics_collector._COMMANDS, either directly or relayed
+through Panorama with target=<serial> (COLLECT_VIA_PANORAMA).
+
+Hosts are told apart by the loopback address the request arrived on, so every
+device gets its own keep-alive pool just like in production:
+
+    Panorama k   127.0.0.<k+1>:<port>
+    device i     127.1.x.y:<port>       (i + 1 spread over the last two octets)
+
+Linux routes all of 127.0.0.0/8 to lo; elsewhere alias the addresses or use
+COLLECT_VIA_PANORAMA=true, which only needs 127.0.0.1.
+
+    python -m bench.simulator --devices 1000 --latency-ms 40 --error-rate 0.01
+
+Faults are drawn per request (--error-rate, --timeout-rate, --auth-fail-rate)
+or per device (--down-rate: connections are reset, --disconnected-rate:
+Panorama lists the device as connected: no). --procs sets how many process
+lines `show system resources` returns, which drives response size.
+"""
+import argparse, hashlib, math, multiprocessing, random, socket, ssl, tempfile, threading, time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from collector.metrics_collector import _COMMANDS
+
+_MODELS   = ("PA-440", "PA-820", "PA-850", "PA-3220", "PA-3440", "PA-5220")
+_VERSIONS = ("10.2.9-h1", "10.2.10", "11.0.4-h2", "11.1.4-h7")
+_PROCS    = ("mgmtsrvr", "devsrvr", "logrcvr", "useridd", "authd", "routed", "ikemgr",
+             "keymgr", "sysd", "masterd", "crypto", "snmpd", "websrvr", "distributord")
+_MOUNTS   = (("/dev/root", "/"), ("none", "/dev"), ("/dev/sda5", "/opt/pancfg"),
+             ("/dev/sda6", "/opt/panrepo"), ("tmpfs", "/dev/shm"), ("cgroup", "/cgroup"),
+             ("/dev/sda8", "/opt/panlogs"), ("tmpfs", "/opt/pancfg/mgmt/ssl/private"),
+             ("/dev/md1", "/opt/panraid/ld1"))
+_OK = '<response status="success"><result>{}</result></response>'
+
+def device_addr(i: int) -> str:
+    n = i + 1
+    return f"127.{1 + (n >> 16)}.{(n >> 8) & 255}.{n & 255}"
+
+def panorama_addr(k: int) -> str:
+    return f"127.0.0.{k + 1}"
+
+class Fleet:
+    """Deterministic per-device facts (from --seed) plus time-varying metrics."""
+
+    def __init__(self, args):
+        self.args = args
+        self.by_addr: dict[str, int] = {}
+        self.by_serial: dict[str, int] = {}
+        self.down: set[int] = set()
+        self.disconnected: set[int] = set()
+        rng = random.Random(args.seed)
+        for i in range(args.devices):
+            self.by_addr[device_addr(i)] = i
+            self.by_serial[self.serial(i)] = i
+            if rng.random() < args.down_rate:
+                self.down.add(i)
+            if rng.random() < args.disconnected_rate:
+                self.disconnected.add(i)
+        self.panoramas = {panorama_addr(k): k for k in range(args.panoramas)}
+
+    def serial(self, i: int) -> str:
+        return f"0132{i:08d}"
+
+    def _rng(self, i: int, salt: str = "") -> random.Random:
+        return random.Random(f"{self.args.seed}:{i}:{salt}")
+
+    # ── Panorama ──
+    def devices_connected(self, k: int) -> str:
+        port = self.args.port
+        entries = []
+        for i in range(k, self.args.devices, self.args.panoramas):
+            rng = self._rng(i)
+            entries.append(
+                f"<entry name=\"{self.serial(i)}\"><serial>{self.serial(i)}</serial>"
+                f"<hostname>sim-fw-{i:05d}</hostname><ip-address>{device_addr(i)}:{port}</ip-address>"
+                f"<model>{rng.choice(_MODELS)}</model><sw-version>{rng.choice(_VERSIONS)}</sw-version>"
+                f"<connected>{'no' if i in self.disconnected else 'yes'}</connected>"
+                f"<ha><state>{rng.choice(('active', 'passive', 'standalone'))}</state></ha></entry>")
+        return _OK.format("<devices>" + "".join(entries) + "</devices>")
+
+    # ── firewall op commands ──
+    def op(self, i: int, label: str) -> str:
+        rng = self._rng(i)
+        wave = math.sin(time.time() / 600 + i)   # slow drift so trends aren't flat
+        if label == "sys-info":
+            return _OK.format(f"<system><hostname>sim-fw-{i:05d}</hostname><serial>{self.serial(i)}</serial>"
+                              f"<model>{rng.choice(_MODELS)}</model><sw-version>{rng.choice(_VERSIONS)}</sw-version>"
+                              "<operational-mode>normal</operational-mode></system>")
+        if label == "session":
+            cap = rng.choice((262142, 1048574, 4194302))
+            return _OK.format(f"<num-max>{cap}</num-max><num-active>{int(cap * (0.3 + 0.2 * wave))}</num-active>"
+                              f"<pps>{rng.randint(100, 90000)}</pps><cps>{rng.randint(10, 3000)}</cps>")
+        if label == "resources":
+            total = rng.choice((7821.3, 15850.4, 64215.0))
+            lines = [f"top - {datetime.now(timezone.utc):%H:%M:%S} up 187 days,  0 users,  "
+                     f"load average: {1.5 + wave:.2f}, 1.57, 1.61",
+                     f"MiB Mem : {total:8.1f} total,    612.3 free, {total * (0.6 + 0.1 * wave):8.1f} used,"
+                     "   4033.3 buff/cache",
+                     f"MiB Swap:   6143.9 total,   5790.2 free, {rng.uniform(0, 900):8.1f} used.   3912.6 avail Mem",
+                     "", "    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND"]
+            lines += [f"{rng.randint(1, 65000):7d} root      20   0 {rng.randint(4000, 4000000):7d} "
+                      f"{rng.randint(100, 900000):6d} {rng.randint(50, 50000):6d} S {rng.random() * 20:5.1f} "
+                      f"{rng.random() * 8:5.1f} {rng.randint(0, 9999):5d}:00.00 {rng.choice(_PROCS)}"
+                      for _ in range(self.args.procs)]
+            return _OK.format("<![CDATA[" + "\n".join(lines) + "\n]]>")
+        if label == "disk-files":
+            lines = ["Filesystem      Size  Used Avail Use% Mounted on"]
+            lines += [f"{fs:<15} 100G   40G   60G  {min(99, rng.randint(5, 80) + int(5 * wave)):>2}% {m}"
+                      for fs, m in _MOUNTS]
+            return _OK.format("<![CDATA[" + "\n".join(lines) + "\n]]>")
+        if label == "logging-service":
+            state = "Active" if rng.random() < 0.9 else "Inactive"
+            return _OK.format(f"<ConnStatus><msg>simulated</msg><conn-status-detail><entry name=\"lc\">"
+                              f"<conn-status>{state}</conn-status></entry></conn-status-detail></ConnStatus>")
+        if label == "device-cert":
+            exp = datetime.now(timezone.utc) + timedelta(days=rng.randint(-10, 365))
+            return _OK.format(f"<device-certificate><status>Success</status><validity>Valid</validity>"
+                              f"<not_valid_after>{exp:%Y/%m/%d %H:%M:%S} GMT</not_valid_after></device-certificate>")
+        raise KeyError(label)
+
+_CMD_LABELS = {cmd: label for label, cmd, _ in _COMMANDS}
+_SHOW_DEVICES = "<show><devices><connected></connected></devices></show>"
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, as the collector's pools expect
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    server: "Server"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: str, status: int = 200) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, msg: str, code: str = "") -> None:
+        attr = f' code="{code}"' if code else ""
+        self._send(f'<response status="error"{attr}><msg><line>{msg}</line></msg></response>')
+
+    def do_GET(self):
+        fleet, args = self.server.fleet, self.server.fleet.args
+        q = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        local = self.connection.getsockname()[0]
+        pano = fleet.panoramas.get(local)
+        relayed = pano is not None and "target" in q
+        dev = fleet.by_serial.get(q["target"]) if relayed else fleet.by_addr.get(local)
+        if dev in fleet.down and not relayed:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)   # looks like a dead management plane
+            return
+        time.sleep(random.lognormvariate(math.log(max(args.latency_ms, 0.01) / 1000), args.jitter))
+        if dev in fleet.down:
+            return self._error(f"{q['target']} not connected")
+
+        if q.get("type") == "keygen":
+            token = hashlib.sha1(f"{local}:{q.get('user')}".encode()).hexdigest()
+            return self._send(_OK.format(f"<key>SIM{token}</key>"))
+        if not q.get("key", "").startswith("SIM") or random.random() < args.auth_fail_rate:
+            return self._send("Invalid credentials", 403)
+        if random.random() < args.timeout_rate:
+            time.sleep(args.hang_secs)
+        if random.random() < args.error_rate:
+            return self._error("simulated failure")
+
+        cmd = q.get("cmd", "")
+        if cmd == _SHOW_DEVICES and pano is not None and "target" not in q:
+            return self._send(fleet.devices_connected(pano))
+        label = _CMD_LABELS.get(cmd)
+        if label is None or dev is None:
+            return self._error(f"unknown command or host ({local})", "17")
+        self._send(fleet.op(dev, label))
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_port = True   # --processes: the kernel spreads connections over them
+
+    def __init__(self, fleet: Fleet, ctx: ssl.SSLContext, bind: str):
+        self.fleet, self.ctx = fleet, ctx
+        super().__init__((bind, fleet.args.port), Handler)
+
+    def finish_request(self, request, client_address):
+        # TLS handshake in the per-connection thread, not the accept loop
+        try:
+            request = self.ctx.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        super().finish_request(request, client_address)
+
+def _tls_context() -> ssl.SSLContext:
+    """Throwaway self-signed certificate (the collector doesn't verify)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "pan-sim")])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=30))
+            .sign(key, hashes.SHA256()))
+    d = Path(tempfile.mkdtemp(prefix="pan-sim-"))
+    (d / "cert.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    (d / "key.pem").write_bytes(key.private_bytes(serialization.Encoding.PEM,
+                                                  serialization.PrivateFormat.PKCS8,
+                                                  serialization.NoEncryption()))
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(d / "cert.pem", d / "key.pem")
+    return ctx
+
+def parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Simulate Panoramas and firewalls on the PAN-OS XML API.")
+    ap.add_argument("--devices", type=int, default=100)
+    ap.add_argument("--panoramas", type=int, default=1)
+    ap.add_argument("--port", type=int, default=8443)
+    ap.add_argument("--bind", default="0.0.0.0", help="must cover 127.0.0.0/8 for per-device hosts")
+    ap.add_argument("--latency-ms", type=float, default=20, help="median per-request latency")
+    ap.add_argument("--jitter", type=float, default=0.5, help="log-normal sigma of the latency")
+    ap.add_argument("--error-rate", type=float, default=0.0, help='share of status="error" answers')
+    ap.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests that hang")
+    ap.add_argument("--hang-secs", type=float, default=30, help="how long a hanging request stalls")
+    ap.add_argument("--auth-fail-rate", type=float, default=0.0, help="share of 403 answers")
+    ap.add_argument("--down-rate", type=float, default=0.0, help="share of devices that reset connections")
+    ap.add_argument("--disconnected-rate", type=float, default=0.0, help="share listed as connected: no")
+    ap.add_argument("--procs", type=int, default=250, help="process lines in show system resources")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--processes", type=int, default=1, help="server processes sharing the port")
+    return ap
+
+def serve(args) -> Server:
+    """Start the simulator on a background thread; returns the running server."""
+    srv = Server(Fleet(args), _tls_context(), args.bind)
+    threading.Thread(target=srv.serve_forever, name="pan-sim", daemon=True).start()
+    return srv
+
+def _serve_forever(args) -> None:
+    Server(Fleet(args), _tls_context(), args.bind).serve_forever()
+
+def main():
+    args = parser().parse_args()
+    # the fleet is derived from --seed, so every process serves the same devices
+    extra = [multiprocessing.Process(target=_serve_forever, args=(args,), daemon=True)
+             for _ in range(args.processes - 1)]
+    for p in extra:
+        p.start()
+    srv = serve(args)
+    print(f"[sim] {args.devices} devices behind {args.panoramas} Panorama(s) on port {args.port} – "
+          f"Panorama at {panorama_addr(0)}:{args.port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
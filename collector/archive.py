@@ -0,0 +1,93 @@
+# collector/archive.py
+"""
+Raw op-command response archive  →  /data/xml-archive  (XML_ARCHIVE=1)
+
+Every device visit appends one gzip member to
+
+    <XML_ARCHIVE_DIR>/<YYYY-MM-DD>/<serial>.jsonl.gz
+
+holding the row timestamp, the inventory fields of the device and the raw XML
+of each command that answered, keyed by its _COMMANDS label:
+
+    {"ts": "2026-10-16T09:00:00+00:00", "dev": {...}, "xml": {"resources": "<response…"}}
+
+collector/reparse.py replays these files through the current parsers. Day
+directories older than XML_ARCHIVE_DAYS are pruned (0 keeps everything).
+"""
+import gzip, json, os, re, shutil, threading
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator
+
+XML_ARCHIVE      = os.getenv("XML_ARCHIVE", "0").lower() in ("1", "true", "yes")
+XML_ARCHIVE_DIR  = Path(os.getenv("XML_ARCHIVE_DIR", "/data/xml-archive"))
+XML_ARCHIVE_DAYS = int(os.getenv("XML_ARCHIVE_DAYS", "0"))
+
+DEV_FIELDS = ("hostname", "serial", "ip", "connected", "ha_state", "panorama")
+
+_lock = threading.Lock()
+_file_locks: dict[Path, threading.Lock] = {}
+_days_seen: set[str] = set()
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+def _file_lock(path: Path) -> threading.Lock:
+    with _lock:
+        return _file_locks.setdefault(path, threading.Lock())
+
+def path_for(serial: str, ts: str) -> Path:
+    day = ts[:10] if ts else datetime.now(timezone.utc).date().isoformat()
+    return XML_ARCHIVE_DIR / day / f"{_UNSAFE_RE.sub('_', serial) or '_'}.jsonl.gz"
+
+def store(dev: dict, ts: str, responses: dict[str, str]) -> None:
+    """Append one visit's raw responses; never raises (archiving must not cost a row)."""
+    if not XML_ARCHIVE or not responses:
+        return
+    path = path_for(dev.get("serial") or dev.get("ip") or "", ts)
+    line = json.dumps({"ts": ts, "dev": {k: dev.get(k, "") for k in DEV_FIELDS},
+                       "xml": responses}) + "\n"
+    try:
+        with _file_lock(path):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(path, "at", encoding="utf-8") as fh:   # one gzip member per visit
+                fh.write(line)
+        if path.parent.name not in _days_seen:   # first write of a day: prune old ones
+            _days_seen.add(path.parent.name)
+            prune()
+    except OSError as e:
+        print(f"[archive] {path} – {e}")
+
+def prune(days: int | None = None) -> int:
+    """Remove day directories older than `days` (default XML_ARCHIVE_DAYS); returns how many."""
+    days = XML_ARCHIVE_DAYS if days is None else days
+    if days <= 0 or not XML_ARCHIVE_DIR.is_dir():
+        return 0
+    cutoff = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+    gone = 0
+    for d in XML_ARCHIVE_DIR.iterdir():
+        if d.is_dir() and d.name < cutoff:
+            shutil.rmtree(d, ignore_errors=True)
+            gone += 1
+    return gone
+
+def files(since: date | None = None, until: date | None = None,
+          serials: set[str] | None = None) -> list[Path]:
+    """Archive files for days in [since, until], optionally only some devices."""
+    if not XML_ARCHIVE_DIR.is_dir():
+        return []
+    out = []
+    for d in sorted(XML_ARCHIVE_DIR.iterdir()):
+        if not d.is_dir() or (since and d.name < since.isoformat()) or (until and d.name > until.isoformat()):
+            continue
+        out += [f for f in sorted(d.glob("*.jsonl.gz"))
+                if not serials or f.name[:-len(".jsonl.gz")] in serials]
+    return out
+
+def read(path: Path) -> Iterator[dict]:
+    """Entries of one archive file; a truncated tail (crash mid-write) ends the file quietly."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+    except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+        print(f"[archive] {path} – stopped at damaged entry ({e})")
@@ -0,0 +1,97 @@
+# collector/breaker.py
+"""
+Per-device circuit breaker + adaptive timeouts  →  /data/breaker.json
+
+A connect error or timeout opens the device's breaker: the rest of its commands
+are skipped and it is left alone for BREAKER_BASE_SECS, doubling per consecutive
+failed run up to BREAKER_MAX_SECS. Once the backoff runs out the next run is a
+probe; success closes the breaker. State survives restarts.
+
+Read/connect timeouts follow each device's observed latency per command label
+(p95 × factor), clamped to the transport defaults, so a dead box costs seconds,
+not minutes. Latency is kept per label because commands differ by orders of
+magnitude: a pooled p95 would follow the frequent fast calls and time out the
+slow, rarely run ones (certificates, logging) on healthy devices.
+"""
+import json, math, os, threading, time
+from pathlib import Path
+
+from collector import statefile, transport
+
+BREAKER_STATE_PATH = Path(os.getenv("BREAKER_STATE_PATH", "/data/breaker.json"))
+BREAKER_BASE_SECS  = float(os.getenv("BREAKER_BASE_SECS", "300"))
+BREAKER_MAX_SECS   = float(os.getenv("BREAKER_MAX_SECS", str(6 * 3600)))
+TIMEOUT_FACTOR     = float(os.getenv("ADAPTIVE_TIMEOUT_FACTOR", "3"))
+TIMEOUT_MIN_SECS   = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "2"))
+_SAMPLES     = 20      # latencies kept per device and command
+_MIN_SAMPLES = 5       # before that, transport defaults apply
+
+_lock = threading.Lock()
+_state: dict[str, dict] | None = None   # key -> {"failures", "open_until", "lat": {label: [secs]}}
+
+def _load() -> dict[str, dict]:
+    global _state
+    if _state is None:
+        _state = {}
+        if BREAKER_STATE_PATH.is_file():
+            try:
+                _state = json.loads(BREAKER_STATE_PATH.read_text())
+            except Exception as e:
+                print(f"[breaker] ignoring unreadable state {BREAKER_STATE_PATH} – {e}")
+    return _state
+
+def _entry(key: str) -> dict:
+    e = _load().setdefault(key, {"failures": 0, "open_until": 0.0, "lat": {}})
+    if not isinstance(e["lat"], dict):   # state from before per-command latency
+        e["lat"] = {}
+    return e
+
+def allow(key: str) -> bool:
+    """False while the device's backoff window is still running."""
+    with _lock:
+        e = _load().get(key)
+        return not e or e["open_until"] <= time.time()
+
+def record_failure(key: str) -> float:
+    """Open (or re-open) the breaker; returns the backoff in seconds."""
+    with _lock:
+        e = _entry(key)
+        e["failures"] += 1
+        backoff = min(BREAKER_BASE_SECS * 2 ** (e["failures"] - 1), BREAKER_MAX_SECS)
+        e["open_until"] = time.time() + backoff
+        return backoff
+
+def record_success(key: str) -> None:
+    with _lock:
+        e = _entry(key)
+        e["failures"], e["open_until"] = 0, 0.0
+
+def observe(key: str, label: str, secs: float) -> None:
+    with _lock:
+        lat = _entry(key)["lat"].setdefault(label, [])
+        lat.append(round(secs, 3))
+        del lat[:-_SAMPLES]
+
+def _p95(samples: list[float]) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, math.ceil(0.95 * len(s)) - 1)]
+
+def timeout_for(key: str, label: str) -> tuple[float, float]:
+    """(connect, read) timeout for one command on this device from its latency history."""
+    with _lock:
+        e = _load().get(key)
+        lat = list(e["lat"].get(label, ())) if e and isinstance(e["lat"], dict) else []
+    if len(lat) < _MIN_SAMPLES:
+        return (transport.CONNECT_TIMEOUT, transport.READ_TIMEOUT)
+    t = max(TIMEOUT_MIN_SECS, _p95(lat) * TIMEOUT_FACTOR)
+    return (min(t, transport.CONNECT_TIMEOUT), min(t, transport.READ_TIMEOUT))
+
+def save() -> None:
+    with _lock:
+        if _state is None:
+            return
+        data = json.dumps(_state)
+    try:
+        statefile.write_atomic(BREAKER_STATE_PATH, data.encode())
+    except OSError as e:
+        print(f"[breaker] state not saved – {e}")
@@ -1,13 +1,23 @@
 # collector/db_write.py
 from __future__ import annotations
-import json, re
+import json, os, re
 from datetime import datetime, timezone
-from typing import List, Dict, Optional
+from typing import List, Dict, NamedTuple, Optional
 
+from sqlalchemy import case, func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
-from db.database import SessionLocal
+from db import deadband
+from db.database import SessionLocal, engine
+from db.latest import upsert_latest
+from db.rollups import refresh_rollups, spans_of
+from db.stats import bump, record_sweeps
 from db.models import Device, MetricSnapshot
 
+# multi-row INSERT … ON CONFLICT ingest (INGEST_BULK=0 falls back to row-at-a-time ORM)
+INGEST_BULK = os.getenv("INGEST_BULK", "1").lower() not in ("0", "false", "no")
+BULK_CHUNK  = int(os.getenv("INGEST_BULK_CHUNK", "1000"))   # rows per statement
+
 # PAN-OS "YYYY/MM/DD HH:MM:SS UTC" (sometimes "… GMT")
 _PANOS_DT_RE = re.compile(
     r"^(?P<y>\d{4})/(?P<m>\d{2})/(?P<d>\d{2}) (?P<H>\d{2}):(?P<M>\d{2}):(?P<S>\d{2}) (UTC|GMT)$"
@@ -17,13 +27,14 @@ def _parse_dt(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
     s = s.strip()
-    # allow ISO with optional trailing Z
+    # allow ISO with optional trailing Z ('/' is never ISO, skip the exception)
     if s.endswith("Z"):
         s = s[:-1]
-    try:
-        return datetime.fromisoformat(s).replace(tzinfo=timezone.utc)
-    except Exception:
-        pass
+    if "/" not in s:
+        try:
+            return datetime.fromisoformat(s).replace(tzinfo=timezone.utc)
+        except Exception:
+            pass
     # PAN-OS "YYYY/MM/DD HH:MM:SS UTC"
     m = _PANOS_DT_RE.match(s + " UTC" if "UTC" not in s and "GMT" not in s else s)
     if m:
@@ -40,12 +51,61 @@ def _f(v):
     except Exception:
         return None
 
+# record keys that map to a column (snapshot or device); everything else goes to extras
+_KNOWN_KEYS = ({c.name for c in MetricSnapshot.__table__.columns}
+               | {c.name for c in Device.__table__.columns} | {"timestamp", "panorama_ip"})
+
+def _extras(d: Dict) -> Optional[Dict]:
+    out = {}
+    for k, v in d.items():
+        if k in _KNOWN_KEYS or v is None or v == "":
+            continue
+        out[k] = _f(v) if k.endswith("_pct") else v
+    return out or None
+
+def _snapshot_values(d: Dict) -> Dict:
+    """MetricSnapshot column values for one collector record (no device link)."""
+    return dict(
+        collected_at=_parse_dt(d.get("timestamp")) or datetime.now(timezone.utc),
+
+        connected=d.get("connected"),
+        ha_state=d.get("ha_state"),
+
+        cpu_one_min=_f(d.get("cpu_one_min")),
+        memory_usage=_f(d.get("memory_usage")),
+        swap_used=_f(d.get("swap_used")),
+
+        session_count=d.get("session_count"),
+        session_max=d.get("session_max"),
+
+        logging_service=d.get("logging_service"),
+
+        device_certificate=d.get("device_certificate"),
+        device_cert_exp=_parse_dt(d.get("device_cert_exp")),
+
+        # disks (store what we have; None is fine)
+        disk_root_pct=_f(d.get("disk_root_pct")),
+        disk_dev_pct=_f(d.get("disk_dev_pct")),
+        disk_opt_pancfg_pct=_f(d.get("disk_opt_pancfg_pct")),
+        disk_opt_panrepo_pct=_f(d.get("disk_opt_panrepo_pct")),
+        disk_dev_shm_pct=_f(d.get("disk_dev_shm_pct")),
+        disk_cgroup_pct=_f(d.get("disk_cgroup_pct")),
+        disk_opt_panlogs_pct=_f(d.get("disk_opt_panlogs_pct")),
+        disk_opt_pancfg_mgmt_ssl_private_pct=_f(d.get("disk_opt_pancfg_mgmt_ssl_private_pct")),
+        disk_opt_panraid_ld1_pct=_f(d.get("disk_opt_panraid_ld1_pct")),
+
+        extras=_extras(d),
+    )
+
 def write_records_to_db(records: List[Dict]) -> int:
     """Insert a batch of device records; ignore duplicate (device_id, collected_at)."""
     if not records:
         return 0
+    if INGEST_BULK:
+        return write_records_bulk(records).inserted
 
     ins = 0
+    new_ids: List[int] = []
     with SessionLocal() as db:
         for d in records:
             serial = d.get("serial") or d.get("hostname")
@@ -53,6 +113,7 @@ def write_records_to_db(records: List[Dict]) -> int:
                 continue
 
             dev = db.get(Device, serial)
+            created = dev is None
             if not dev:
                 dev = Device(
                     serial=serial,
@@ -71,53 +132,150 @@ def write_records_to_db(records: List[Dict]) -> int:
                 dev.model = d.get("model") or dev.model
                 dev.pan_os_version = d.get("pan_os_version") or dev.pan_os_version
 
-            snap = MetricSnapshot(
-                device=dev,
-                collected_at=_parse_dt(d.get("timestamp")) or datetime.now(timezone.utc),
-
-                connected=d.get("connected"),
-                ha_state=d.get("ha_state"),
-
-                cpu_one_min=_f(d.get("cpu_one_min")),
-                memory_usage=_f(d.get("memory_usage")),
-                swap_used=_f(d.get("swap_used")),
-
-                session_count=d.get("session_count"),
-                session_max=d.get("session_max"),
-
-                logging_service=d.get("logging_service"),
-
-                device_certificate=d.get("device_certificate"),
-                device_cert_exp=_parse_dt(d.get("device_cert_exp")),
-
-                # disks (store what we have; None is fine)
-                disk_root_pct=_f(d.get("disk_root_pct")),
-                disk_dev_pct=_f(d.get("disk_dev_pct")),
-                disk_opt_pancfg_pct=_f(d.get("disk_opt_pancfg_pct")),
-                disk_opt_panrepo_pct=_f(d.get("disk_opt_panrepo_pct")),
-                disk_dev_shm_pct=_f(d.get("disk_dev_shm_pct")),
-                disk_cgroup_pct=_f(d.get("disk_cgroup_pct")),
-                disk_opt_panlogs_pct=_f(d.get("disk_opt_panlogs_pct")),
-                disk_opt_pancfg_mgmt_ssl_private_pct=_f(d.get("disk_opt_pancfg_mgmt_ssl_private_pct")),
-                disk_opt_panraid_ld1_pct=_f(d.get("disk_opt_panraid_ld1_pct")),
-            )
-
+            vals = {"device_id": serial, **_snapshot_values(d)}
+            changes = deadband.apply(db, [vals])
+            del vals["device_id"]
+            snap = MetricSnapshot(device=dev, **vals)
             db.add(snap)
             try:
+                db.flush()
+                deadband.record(db, changes)
+                upsert_latest(db, [{"device_id": serial, "snapshot_id": snap.id,
+                                    "collected_at": snap.collected_at}])
+                bump(db, rows=1, devices=int(created), last=snap.collected_at)
                 db.commit()
                 ins += 1
+                new_ids.append(snap.id)
             except IntegrityError:
                 db.rollback()  # duplicate; ignore
+
+        if new_ids:
+            rows = db.execute(
+                select(MetricSnapshot.device_id, MetricSnapshot.collected_at)
+                .where(MetricSnapshot.id.in_(new_ids))
+            ).all()
+            refresh_rollups(db, spans_of(rows))
+            db.commit()
     return ins
 
-def write_json_to_db(json_path: str) -> int:
+class IngestResult(NamedTuple):
+    inserted: int   # new metric_snapshots rows
+    skipped: int    # duplicates of an existing (device_id, collected_at)
+    updated: int = 0   # backfill only: existing rows filled in
+
+_DEVICE_FIELDS = ("hostname", "ip", "panorama", "model", "pan_os_version")
+
+def write_records_bulk(records: List[Dict], chunk: int = BULK_CHUNK,
+                       backfill: bool = False) -> IngestResult:
+    """Same semantics as write_records_to_db, as a few multi-row statements in one transaction.
+
+    Devices are upserted (non-empty values win, like the ORM path) and snapshots go in
+    with ON CONFLICT ON CONSTRAINT uq_device_ts DO NOTHING, so duplicates are counted
+    instead of costing a rollback each.
+
+    With `backfill` (collector/reparse.py) an existing snapshot is updated instead:
+    every non-NULL value in the record replaces the stored one and extras are merged.
+    Deadband is skipped, since historical rows must not move the change log.
+    """
+    devices: Dict[str, Dict] = {}
+    snaps: List[Dict] = []
+    for d in records:
+        serial = d.get("serial") or d.get("hostname")
+        if not serial:
+            continue
+        dev = devices.setdefault(serial, {"serial": serial, **dict.fromkeys(_DEVICE_FIELDS)})
+        for k in _DEVICE_FIELDS:   # later non-empty values win, as in the row-at-a-time path
+            if d.get(k):
+                dev[k] = d[k]
+        snaps.append({"device_id": serial, **_snapshot_values(d)})
+    if backfill:   # DO UPDATE may touch a row only once per statement
+        snaps = list({(r["device_id"], r["collected_at"]): r for r in snaps}.values())
+    if not snaps:
+        return IngestResult(0, 0)
+
+    tbl = Device.__table__
+    snap_tbl = MetricSnapshot.__table__
+    inserted = updated = new_devices = 0
+    touched: List = []
+    latest: List[Dict] = []
+    with engine.begin() as conn:
+        # INGEST_DEADBAND: NULLs out unchanged fields
+        changes = deadband.apply(conn, snaps) if not backfill else []
+        named = [r for r in devices.values() if r["hostname"]]
+        # no hostname anywhere in the batch: a new device is named after its serial,
+        # an existing one keeps its stored hostname (as in the row-at-a-time path)
+        unnamed = [r | {"hostname": r["serial"]} for r in devices.values() if not r["hostname"]]
+        for dev_rows, fields in ((named, _DEVICE_FIELDS), (unnamed, _DEVICE_FIELDS[1:])):
+            for i in range(0, len(dev_rows), chunk):
+                stmt = pg_insert(tbl).values(dev_rows[i:i + chunk])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[tbl.c.serial],
+                    set_={k: func.coalesce(func.nullif(stmt.excluded[k], ""), tbl.c[k])
+                          for k in fields},
+                ).returning(literal_column("xmax = 0"))   # true for freshly inserted rows
+                new_devices += sum(1 for (fresh,) in conn.execute(stmt) if fresh)
+
+        for i in range(0, len(snaps), chunk):
+            stmt = pg_insert(snap_tbl).values(snaps[i:i + chunk])
+            if backfill:
+                stmt = stmt.on_conflict_do_update(
+                    constraint="uq_device_ts", set_=_backfill_set(stmt, snap_tbl))
+            else:
+                stmt = stmt.on_conflict_do_nothing(constraint="uq_device_ts")
+            res = conn.execute(stmt.returning(
+                snap_tbl.c.id, snap_tbl.c.device_id, snap_tbl.c.collected_at,
+                literal_column("xmax = 0").label("fresh"))).all()
+            new = [r for r in res if r.fresh]
+            inserted += len(new)
+            updated += len(res) - len(new)
+            latest.extend({"device_id": r.device_id, "snapshot_id": r.id,
+                           "collected_at": r.collected_at} for r in new)
+            touched.extend((r.device_id, r.collected_at) for r in res)
+        deadband.record(conn, changes)
+
+        refresh_rollups(conn, spans_of(touched))
+        # last: takes the fleet-wide seq lock, held until commit
+        upsert_latest(conn, latest)
+        bump(conn, rows=inserted, devices=new_devices,
+             last=max((ts for _, ts in touched), default=None))
+    return IngestResult(inserted, len(snaps) - inserted - updated, updated)
+
+def _backfill_set(stmt, tbl) -> Dict:
+    """ON CONFLICT SET for backfill: new non-NULL values win, extras are merged.
+
+    A column that gets a value is unmasked too, or readers would keep filling it
+    from the change log (deadband.filled) and never see the re-parsed value.
+    """
+    keep = {"id", "device_id", "collected_at", "deadband_mask", "extras"}
+    out = {c.name: func.coalesce(stmt.excluded[c.name], c) for c in tbl.c if c.name not in keep}
+    out["extras"] = func.coalesce(tbl.c.extras.op("||")(stmt.excluded.extras),
+                                  tbl.c.extras, stmt.excluded.extras)
+    filled = sum((case((stmt.excluded[name].isnot(None), bit), else_=0)
+                  for name, bit in deadband.BIT.items()), literal(0))
+    out["deadband_mask"] = tbl.c.deadband_mask.op("&")(
+        literal(sum(deadband.BIT.values())).op("#")(filled.self_group()))   # NULL stays NULL
+    return out
+
+def write_sweep_stats(started: datetime, sweeps: List[Dict]) -> None:
+    """Store the per-Panorama outcome of a collector sweep for /health."""
+    with engine.begin() as conn:
+        record_sweeps(conn, started, sweeps)
+
+def _load_json(json_path: str) -> List[Dict]:
     with open(json_path, "r") as f:
         data = json.load(f)
     if isinstance(data, dict) and "devices" in data:
         data = data["devices"]
     if not isinstance(data, list):
         raise ValueError("Unexpected JSON shape; expected a list of devices.")
-    return write_records_to_db(data)
+    return data
+
+def ingest_json(json_path: str) -> IngestResult:
+    """Bulk-load a collector snapshot file, reporting inserted vs duplicate rows."""
+    return write_records_bulk(_load_json(json_path))
+
+def write_json_to_db(json_path: str) -> int:
+    return write_records_to_db(_load_json(json_path))
 
 # ---- Compatibility alias (fixes ImportError: write_json) ----
 def write_json(json_path: str) -> int:
@@ -2,19 +2,33 @@
 set -euo pipefail
 echo "[collector] starting… interval=${COLLECT_INTERVAL:-3600}s"
 
+# Daemon mode: per-parser cadences, rows stream straight to Postgres
+if [ "${COLLECT_MODE:-sweep}" = "daemon" ]; then
+  exec python -m collector.scheduler
+fi
+
+# Sharded mode: replicas split the fleet through Postgres leases
+if [ "${COLLECT_MODE:-sweep}" = "sharded" ]; then
+  exec python -m collector.shards
+fi
+
 try_ingest() {
   local p="$1"
   if [ -f "$p" ]; then
     echo "[collector] ingesting to Postgres from $p"
     METRICS_JSON_PATH="$p" python - <<'PY'
-from collector.db_write import write_json
+from collector.db_write import INGEST_BULK, ingest_json, write_json
 import os
 path = os.environ.get("METRICS_JSON_PATH")
 if not path:
     raise SystemExit("METRICS_JSON_PATH not set")
 try:
-    n = write_json(path)
-    print(f"[collector] wrote {n} rows to Postgres")
+    if INGEST_BULK:
+        res = ingest_json(path)
+        print(f"[collector] wrote {res.inserted} rows to Postgres ({res.skipped} duplicates skipped)")
+    else:
+        n = write_json(path)
+        print(f"[collector] wrote {n} rows to Postgres")
 except Exception as e:
     print(f"[collector] Postgres write failed: {e}")
 PY
@@ -23,10 +37,16 @@ PY
 
 while true; do
   echo "[collector] run at $(date -Iseconds)"
-  python -m collector.metrics_collector || echo "[collector] run failed (non-fatal)"
+  rc=0
+  python -m collector.metrics_collector || rc=$?
+  [ "$rc" -eq 0 ] || echo "[collector] run failed (non-fatal, exit $rc)"
 
+  # Rows already streamed to Postgres when COLLECT_SINKS includes "db",
+  # unless the db sink gave up on some of them (exit 3)
+  if [[ ",${COLLECT_SINKS:-csv,json}," == *",db,"* ]] && [ "$rc" -ne 3 ]; then
+    :
   # Try common snapshot locations
-  if [ -n "${METRICS_JSON_PATH:-}" ] && [ -f "$METRICS_JSON_PATH" ]; then
+  elif [ -n "${METRICS_JSON_PATH:-}" ] && [ -f "$METRICS_JSON_PATH" ]; then
     try_ingest "$METRICS_JSON_PATH"
   else
     try_ingest "/data/device_metrics.json"
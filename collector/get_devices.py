@@ -1,14 +1,13 @@
 import yaml
-import requests
 import xml.etree.ElementTree as ET
-import urllib3
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from collector import transport
+from collector.pan_connect import check_auth
 
 def fetch_managed_devices(pano_ip, api_key):
-    url = f"https://{pano_ip}/api/?type=op&cmd=<show><devices><connected></connected></devices></show>&key={api_key}"
-    response = requests.get(url, verify=False, timeout=10)
-    tree = ET.fromstring(response.text)
+    params = {"type": "op", "cmd": "<show><devices><connected></connected></devices></show>", "key": api_key}
+    response = transport.get(pano_ip, params)
+    tree = ET.fromstring(check_auth(response, pano_ip))
     devices = []
 
     for entry in tree.findall('.//entry'):
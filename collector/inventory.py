@@ -0,0 +1,161 @@
+# collector/inventory.py
+"""
+Panorama inventory cache  →  /data/inventory.json
+
+Collection starts from the device list the last refresh stored instead of
+waiting for every Panorama's `show devices connected`. Refreshes poll all
+Panoramas concurrently, so one slow Panorama delays only its own devices, and
+a Panorama that fails keeps its cached devices. Each refresh logs what changed
+since the last one rather than the whole list:
+
+    [inventory] pano-eu: +fw-new (013201000123), -fw-old, fw-ber ip 10.0.0.5→10.0.0.9, fw-muc connected yes→no
+"""
+import json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from collector import get_devices, key_cache, pan_connect, statefile
+
+INVENTORY_CACHE_PATH = Path(os.getenv("INVENTORY_CACHE_PATH", "/data/inventory.json"))
+INVENTORY_MAX_AGE    = float(os.getenv("INVENTORY_MAX_AGE", str(7 * 86400)))   # older caches are ignored
+
+_WATCHED = ("ip", "connected", "ha_state", "hostname", "model")   # fields a change report covers
+
+_lock = threading.Lock()
+_cache: dict | None = None   # {"panoramas": {name: {"at": epoch, "devices": [...]}}}
+
+def _load() -> dict:
+    global _cache
+    if _cache is None:
+        _cache = {"panoramas": {}}
+        if INVENTORY_CACHE_PATH.is_file():
+            try:
+                _cache = json.loads(INVENTORY_CACHE_PATH.read_text())
+            except Exception as e:
+                print(f"[inventory] ignoring unreadable cache {INVENTORY_CACHE_PATH} – {e}")
+    return _cache
+
+def _save() -> None:
+    try:
+        statefile.write_atomic(INVENTORY_CACHE_PATH, json.dumps(_cache).encode())
+    except OSError as e:
+        print(f"[inventory] cache not saved – {e}")
+
+def _key(dev: dict) -> str:
+    return dev.get("serial") or dev.get("ip") or dev.get("hostname") or ""
+
+def _name(dev: dict) -> str:
+    return dev.get("hostname") or dev.get("serial") or dev.get("ip") or "?"
+
+def diff(old: list[dict], new: list[dict]) -> list[str]:
+    """Devices added / removed and watched fields that changed, as short log items."""
+    before = {_key(d): d for d in old}
+    after  = {_key(d): d for d in new}
+    out = [f"+{_name(d)} ({k})" for k, d in after.items() if k not in before]
+    out += [f"-{_name(d)}" for k, d in before.items() if k not in after]
+    for k, d in after.items():
+        prev = before.get(k)
+        if prev is None:
+            continue
+        out += [f"{_name(d)} {f} {prev.get(f) or '∅'}→{d.get(f) or '∅'}"
+                for f in _WATCHED if (prev.get(f) or "") != (d.get(f) or "")]
+    return out
+
+def cached(cfg: dict) -> list[dict]:
+    """Devices stored for the Panoramas in `cfg` (empty if never refreshed or stale)."""
+    cutoff = time.time() - INVENTORY_MAX_AGE
+    with _lock:
+        pans = _load()["panoramas"]
+        return [dict(d) for p in cfg["panoramas"]
+                for d in (pans.get(p["name"]) or {}).get("devices", [])
+                if pans[p["name"]]["at"] >= cutoff]
+
+def fetch(p: dict, creds: tuple[str, str]) -> list[dict]:
+    """One Panorama's managed devices, tagged with panorama / panorama_ip (raises on failure)."""
+    user, pw = creds
+    pano_key = key_cache.get_key(p["ip"], user, pw)
+    try:
+        found = get_devices.fetch_managed_devices(p["ip"], pano_key)
+    except pan_connect.AuthError:
+        key_cache.invalidate(p["ip"], pano_key)
+        found = get_devices.fetch_managed_devices(p["ip"], key_cache.get_key(p["ip"], user, pw))
+    for d in found:
+        d["panorama"] = p["name"]
+        d["panorama_ip"] = p["ip"]
+    return found
+
+def refresh(cfg: dict, creds: tuple[str, str],
+            errors: dict[str, str] | None = None) -> tuple[list[dict], list[str]]:
+    """Poll every Panorama at once, store the result and return (devices, changes).
+
+    A Panorama that fails keeps its cached devices; its error goes into `errors`.
+    """
+    pans = cfg["panoramas"]
+    results: dict[str, list[dict]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(pans)), thread_name_prefix="inventory") as pool:
+        futs = {p["name"]: pool.submit(fetch, p, creds) for p in pans}
+        for name, fut in futs.items():
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                print(f"[!] panorama {name} – {e}")
+                if errors is not None:
+                    errors[name] = str(e)
+
+    changes: list[str] = []
+    now = time.time()
+    with _lock:
+        stored = _load()["panoramas"]
+        for name, found in results.items():
+            prev = stored.get(name)
+            delta = diff(prev["devices"], found) if prev else []
+            if delta:
+                print(f"[inventory] {name}: " + ", ".join(delta))
+                changes += [f"{name}: {c}" for c in delta]
+            stored[name] = {"at": now, "devices": found}
+        _save()
+    return _merged(cfg, results), changes
+
+def _merged(cfg: dict, results: dict[str, list[dict]]) -> list[dict]:
+    """Fresh devices where the poll worked, cached ones (any age) where it failed."""
+    with _lock:
+        stored = _load()["panoramas"]
+        return [dict(d) for p in cfg["panoramas"]
+                for d in (results[p["name"]] if p["name"] in results
+                          else (stored.get(p["name"]) or {}).get("devices", []))]
+
+class Refresher:
+    """Background thread calling refresh() every `interval` seconds.
+
+    `on_change(devices, changes)` runs after every refresh that changed something
+    (and after the first one).
+    """
+    def __init__(self, cfg: dict, creds: tuple[str, str], interval: float, on_change=None):
+        self.cfg, self.creds, self.interval = cfg, creds, interval
+        self.on_change = on_change
+        self.errors: dict[str, str] = {}
+        self.done = threading.Event()        # set once the first refresh has finished
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="inventory", daemon=True)
+
+    def start(self) -> "Refresher":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        first = True
+        while not self._stop.is_set():
+            try:
+                errors: dict[str, str] = {}
+                devices, changes = refresh(self.cfg, self.creds, errors)
+                self.errors = errors
+                if self.on_change and (first or changes):
+                    self.on_change(devices, changes)
+            except Exception as e:
+                print(f"[inventory] refresh failed – {e}")
+            first = False
+            self.done.set()
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
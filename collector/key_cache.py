@@ -0,0 +1,84 @@
+# collector/key_cache.py
+"""
+Persistent XML-API key cache  →  /data/api_keys.enc
+
+Keys survive collector restarts so steady-state runs do no keygen at all.
+The file is Fernet-encrypted with KEY_CACHE_SECRET; without a secret the cache
+stays in memory only (the old per-process behaviour). Every entry carries its
+own expiry, and a key that comes back 403 / invalid is dropped and regenerated.
+"""
+import base64, hashlib, json, os, threading, time
+from pathlib import Path
+
+from collector import pan_connect, statefile
+
+KEY_CACHE_PATH   = Path(os.getenv("KEY_CACHE_PATH", "/data/api_keys.enc"))
+KEY_CACHE_SECRET = os.getenv("KEY_CACHE_SECRET", "")
+KEY_CACHE_TTL    = int(os.getenv("KEY_CACHE_TTL", str(7 * 86400)))   # seconds
+
+_lock = threading.Lock()
+_host_locks: dict[str, threading.Lock] = {}
+_keys: dict[str, dict] | None = None   # ip -> {"key": str, "expires": epoch}
+
+def _fernet():
+    if not KEY_CACHE_SECRET:
+        return None
+    from cryptography.fernet import Fernet
+    raw = hashlib.sha256(KEY_CACHE_SECRET.encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(raw))
+
+def _load() -> dict[str, dict]:
+    global _keys
+    if _keys is not None:
+        return _keys
+    _keys = {}
+    f = _fernet()
+    if f and KEY_CACHE_PATH.is_file():
+        try:
+            _keys = json.loads(f.decrypt(KEY_CACHE_PATH.read_bytes()))
+        except Exception as e:
+            print(f"[keys] ignoring unreadable cache {KEY_CACHE_PATH} – {e}")
+    return _keys
+
+def _save() -> None:
+    f = _fernet()
+    if not f:
+        return
+    now = time.time()
+    live = {ip: e for ip, e in _keys.items() if e["expires"] > now}
+    try:
+        statefile.write_atomic(KEY_CACHE_PATH, f.encrypt(json.dumps(live).encode()), mode=0o600)
+    except OSError as e:
+        print(f"[keys] cache not saved – {e}")
+
+def _host_lock(ip: str) -> threading.Lock:
+    with _lock:
+        return _host_locks.setdefault(ip, threading.Lock())
+
+def cached(ip: str) -> str | None:
+    with _lock:
+        e = _load().get(ip)
+    return e["key"] if e and e["expires"] > time.time() else None
+
+def get_key(ip: str, user: str, pw: str, ttl: int | None = None) -> str:
+    """Cached key for `ip`, running keygen only on a miss or expiry (raises on failure)."""
+    key = cached(ip)
+    if key:
+        return key
+    with _host_lock(ip):           # one keygen per host even with concurrent callers
+        key = cached(ip)
+        if key:
+            return key
+        key = pan_connect.get_api_key(ip, user, pw)
+        with _lock:
+            _load()[ip] = {"key": key, "expires": time.time() + (ttl or KEY_CACHE_TTL)}
+            _save()
+        return key
+
+def invalidate(ip: str, key: str | None = None) -> None:
+    """Drop the cached key; with `key`, only if it is still the one that failed."""
+    with _lock:
+        e = _load().get(ip)
+        if e and (key is None or e["key"] == key):
+            del _keys[ip]
+            _save()
@@ -1,31 +1,43 @@
 #!/usr/bin/env python3
 """
-Collect firewall health metrics  →  device_metrics.csv / .json
+Collect firewall health metrics  →  Postgres and/or device_metrics.csv / .json
 (… header unchanged …)
 """
 # ---- distutils shim for Py ≥ 3.12 – keeps older dependencies happy (unchanged)
 # ( … unchanged shim here … )
 # ------------------------------------------------------------------------------
 
-import re, yaml, requests, urllib3, xml.etree.ElementTree as ET
+import os, re, sys, threading, time, yaml, xml.etree.ElementTree as ET
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import zip_longest
 from collector.config_loader import load_config
 from datetime import datetime, timezone, timedelta  # ← added timedelta
-import pandas as pd
 
-from collector import pan_connect, get_devices
+from collector import archive, breaker, inventory, pan_connect, key_cache, pipeline, transport
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-_API_TIMEOUT = 10
 DEBUG_XML    = False
 
+# fleet concurrency (COLLECT_WORKERS=1 keeps the old one-device-at-a-time sweep)
+COLLECT_WORKERS      = int(os.getenv("COLLECT_WORKERS", "1"))
+COLLECT_PER_PANORAMA = int(os.getenv("COLLECT_PER_PANORAMA", "0"))  # 0 = no cap
+COLLECT_PER_DEVICE   = int(os.getenv("COLLECT_PER_DEVICE", "1"))    # >1 fans a device's commands out
+# devices Panorama reports as connected: no – "last" (collected after the rest) or "skip"
+COLLECT_DISCONNECTED = os.getenv("COLLECT_DISCONNECTED", "last").lower()
+# proxy op commands through the managing Panorama (target=<serial>) instead of per-device keys
+COLLECT_VIA_PANORAMA = os.getenv("COLLECT_VIA_PANORAMA", "").lower() in ("1", "true", "yes")
+
 # ───────────── low-level helpers ─────────────
-def api_get(ip: str, key: str, cmd_xml: str) -> str:
-    r = requests.get(
-        f"https://{ip}/api/?type=op&cmd={cmd_xml}&key={key}",
-        verify=False, timeout=_API_TIMEOUT,
-    )
+def api_get(ip: str, key: str, cmd_xml: str, target: str | None = None,
+            timeout=None) -> str:
+    params = {"type": "op", "cmd": cmd_xml, "key": key}
+    if target:
+        params["target"] = target   # Panorama relays the command to this serial
+    r = transport.get(ip, params, timeout)
+    text = pan_connect.check_auth(r, ip)   # AuthError → caller drops the key
     r.raise_for_status()
-    return r.text
+    return text
 
 def _intval(s: str | None):
     try:
@@ -35,11 +47,70 @@ def _intval(s: str | None):
 
 # ───────────── regexes ─────────────
 _DSK_USE_RE = re.compile(r"(?P<pct>\d+)%$")
+_MEM_RE     = re.compile(r"MiB Mem.+?([\d.]+)\s+total.+?([\d.]+)\s+used", re.S)
+_LOAD_RE    = re.compile(r"load average:\s*([\d.]+),")
+_SWAP_RE    = re.compile(r"MiB Swap.+?([\d.]+)\s+used", re.S)
+_ACTIVE_RE  = re.compile(r"\bActive\b", re.I)
+# the usual shape of a text-only answer (top, df): result = one CDATA block, nothing else
+_CDATA_HEAD_RE = re.compile(r"\s*<response[^<>]*><result><!\[CDATA\[")
+_CDATA_TAIL_RE = re.compile(r"\]\]></result></response>\s*")
 
 # ───────────── XML helpers ─────────────
+# Parsers give byte-identical output to a full ET.fromstring() on any well-formed
+# response; the fast paths below only skip work (bench/parsers.py checks this).
+_SCAN_CHUNK = 256   # bytes fed to the pull parser between checks for "found everything"
+
 def _txt(xml: str) -> str:
+    head = _CDATA_HEAD_RE.match(xml)
+    if head:
+        end = xml.find("]]>", head.end())
+        # expat would normalise CR/LF, so those go the slow way
+        if end >= 0 and _CDATA_TAIL_RE.fullmatch(xml, end) and xml.find("\r", head.end(), end) < 0:
+            return xml[head.end():end]
     return ET.fromstring(xml).findtext(".//result") or ""
 
+def _scan(xml: str, tags: tuple[str, ...], parent: str | None = None,
+          done=None) -> dict[str, str] | None:
+    """findtext() of each of `tags`, parsing only as far as needed.
+
+    parent=None looks at every descendant of the root (".//tag"), otherwise only at
+    direct children of the first `parent` element (".//parent" then "tag"). Tags
+    that don't occur are missing from the result. None if `parent` never shows up.
+    Parsing stops once every tag was seen, or as soon as `done(found)` is true.
+    """
+    if len(xml) <= 2 * _SCAN_CHUNK:   # nothing to skip; one C-level parse is cheaper
+        root = ET.fromstring(xml)
+        box = root.find(f".//{parent}") if parent else root
+        if box is None:
+            return None
+        return {t: v for t in tags if (v := box.findtext(t if parent else f".//{t}")) is not None}
+    want = set(tags)
+    out: dict[str, str] = {}
+    pending: dict[str, ET.Element] = {}
+    pp = ET.XMLPullParser(("start", "end"))
+    depth, scope, box = 0, (0 if parent is None else None), None
+    for i in range(0, len(xml), _SCAN_CHUNK):
+        pp.feed(xml[i:i + _SCAN_CHUNK])
+        for ev, el in pp.read_events():
+            if ev == "start":
+                depth += 1
+                if scope is None and el.tag == parent:
+                    scope, box = depth, el
+                elif (el.tag in want and el.tag not in pending and scope is not None
+                      and (depth == scope + 1 if parent else depth > 1)):
+                    pending[el.tag] = el
+                continue
+            depth -= 1
+            if pending.get(el.tag) is el:
+                out[el.tag] = el.text or ""
+                want.discard(el.tag)
+                if not want or (done and done(out)):
+                    return out
+            elif el is box:
+                return out
+    pp.close()
+    return out if scope is not None else None
+
 # ───────────── device-cert time normalization (NEW) ─────────────
 # Accepts 'YYYY/MM/DD HH:MM:SS <TZ>' where TZ can be UTC/GMT/PDT/PST/EDT/…
 _CERT_RE = re.compile(
@@ -54,50 +125,53 @@ _TZ_OFFSETS = {
     "AKDT": -8, "AKST": -9,
     "HDT": -9, "HST": -10,
 }
+_TZ_INFOS = {k: timezone(timedelta(hours=v)) for k, v in _TZ_OFFSETS.items()}
 def _normalize_cert_ts(s: str | None) -> str:
     """Return ISO-8601 UTC ('...Z') or '' if not parseable."""
     if not s:
         return ""
     s = s.strip()
 
-    # Already ISO?
-    try:
-        if s.endswith("Z"):
-            dt = datetime.fromisoformat(s[:-1]).replace(tzinfo=timezone.utc)
-            return dt.replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
-        dt = datetime.fromisoformat(s)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt.astimezone(timezone.utc).replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
-    except Exception:
-        pass
-
-    m = _CERT_RE.match(s) or _CERT_RE.match(s + " UTC")
-    if not m:
-        return ""
+    # PAN-OS format first: it is what devices send, and fromisoformat never takes '/'
+    m = _CERT_RE.match(s)
+    if m is None:
+        # Already ISO?
+        try:
+            if s.endswith("Z"):
+                dt = datetime.fromisoformat(s[:-1]).replace(tzinfo=timezone.utc)
+                return dt.replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
+            dt = datetime.fromisoformat(s)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt.astimezone(timezone.utc).replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
+        except Exception:
+            pass
+        m = _CERT_RE.match(s + " UTC")
+        if not m:
+            return ""
 
     y, mo, d = int(m["y"]), int(m["m"]), int(m["d"])
     H, M, S = int(m["H"]), int(m["M"]), int(m["S"])
     tz_abbr = (m.group("tz") or "UTC").upper()
-    off = _TZ_OFFSETS.get(tz_abbr)
-    if off is None:
+    tz = _TZ_INFOS.get(tz_abbr)
+    if tz is None:
         # Unknown tz → treat as UTC to avoid dropping the value
         dt_utc = datetime(y, mo, d, H, M, S, tzinfo=timezone.utc)
         return dt_utc.replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
-    dt_local = datetime(y, mo, d, H, M, S, tzinfo=timezone(timedelta(hours=off)))
+    dt_local = datetime(y, mo, d, H, M, S, tzinfo=tz)
     return dt_local.astimezone(timezone.utc).replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 # ───────────── individual parsers (unchanged) ─────────────
 def p_system(xml: str):
-    t = ET.fromstring(xml)
-    return {"pan_os_version": t.findtext(".//sw-version"),
-            "model":          t.findtext(".//model")}
+    f = _scan(xml, ("sw-version", "model"))
+    return {"pan_os_version": f.get("sw-version"),
+            "model":          f.get("model")}
 
 def p_resources(xml: str):
     txt  = _txt(xml)
-    mem  = re.search(r"MiB Mem.+?([\d.]+)\s+total.+?([\d.]+)\s+used", txt, re.S)
-    cpu  = re.search(r"load average:\s*([\d.]+),", txt)
-    swap = re.search(r"MiB Swap.+?([\d.]+)\s+used", txt, re.S)
+    mem  = _MEM_RE.search(txt)
+    cpu  = _LOAD_RE.search(txt)
+    swap = _SWAP_RE.search(txt)
     return {
         "cpu_one_min":  cpu.group(1) if cpu else None,
         "memory_usage": (round(float(mem.group(2)) / float(mem.group(1)) * 100, 2)
@@ -105,11 +179,15 @@ def p_resources(xml: str):
         "swap_used":    float(swap.group(1)) if swap else None,
     }
 
+_SESSION_TAGS = ("num-active", "active", "num-max", "max", "limit", "session-limit")
+
 def p_session(xml: str):
-    res = ET.fromstring(xml).find(".//result")
-    cur = res.findtext("num-active") or res.findtext("active")
-    mxx = (res.findtext("num-max") or res.findtext("max")
-           or res.findtext("limit") or res.findtext("session-limit"))
+    res = _scan(xml, _SESSION_TAGS, "result", done=lambda f: f.get("num-active") and f.get("num-max"))
+    if res is None:
+        raise ValueError("no <result> in session info")
+    cur = res.get("num-active") or res.get("active")
+    mxx = (res.get("num-max") or res.get("max")
+           or res.get("limit") or res.get("session-limit"))
     return {"session_count": _intval(cur), "session_max": _intval(mxx)}
 
 def p_disk_files(xml: str):
@@ -138,7 +216,7 @@ _CONN_STATUS_PATH = ".//conn-status"
 def p_logging(xml: str):
     tree = ET.fromstring(xml)
     for node in tree.findall(_CONN_STATUS_PATH):
-        if re.search(r"\bActive\b", (node.text or ""), flags=re.I):
+        if _ACTIVE_RE.search(node.text or ""):
             return {"logging_service": "yes"}
     summary_msg = (tree.findtext(".//ConnStatus/msg") or "").lower()
     if "established" in summary_msg:
@@ -162,23 +240,51 @@ def p_device_cert(xml: str):
         # still include the (normalized-or-empty) value for visibility
         return {"device_certificate": "no" if cert is not None else "", "device_cert_exp": exp_iso}
 
+# ───────────── concurrency limits ─────────────
+_slots_lock = threading.Lock()
+_device_slots: dict[str, threading.BoundedSemaphore] = {}
+_pano_slots: dict[str, threading.BoundedSemaphore] = {}
+
+def _slot(table: dict, name: str, limit: int) -> threading.BoundedSemaphore | None:
+    if limit <= 0:
+        return None
+    with _slots_lock:
+        sem = table.get(name)
+        if sem is None:
+            sem = table[name] = threading.BoundedSemaphore(limit)
+        return sem
+
+@contextmanager
+def _limited(table: dict, name: str, limit: int):
+    sem = _slot(table, name, limit)
+    if sem is None:
+        yield
+        return
+    with sem:
+        yield
+
 # ───────────── per-device collector ─────────────
-_firewall_keys: dict[str, str] = {}
+# (log label, op command, parser) – also the order results are merged into a row
+_COMMANDS = (
+    ("session",         "<show><session><info></info></session></show>", p_session),
+    ("sys-info",        "<show><system><info></info></system></show>", p_system),
+    ("resources",       "<show><system><resources></resources></system></show>", p_resources),
+    ("disk-files",      "<show><system><disk-space><files></files></disk-space></system></show>",
+                        p_disk_files),
+    ("logging-service", "<request><logging-service-forwarding><status></status>"
+                        "</logging-service-forwarding></request>", p_logging),
+    ("device-cert",     "<show><device-certificate><status></status></device-certificate></show>",
+                        p_device_cert),
+)
 
 def fw_key(ip: str, user: str, pw: str) -> str | None:
-    if ip in _firewall_keys:
-        return _firewall_keys[ip]
     try:
-        key = pan_connect.get_api_key(ip, user, pw)
-        _firewall_keys[ip] = key
-        return key
+        return key_cache.get_key(ip, user, pw)   # persistent; keygen only on miss/expiry
     except Exception as e:
         print(f"[!] keygen {ip} – {e}")
         return None
 
-def collect(dev: dict, creds: tuple[str, str]):
-    """Always use a per-device key; never reuse Panorama key for device calls."""
-    user, pw = creds
+def _base_row(dev: dict) -> dict:
     row = {k: dev.get(k, "") for k in
            ("hostname", "serial", "ip", "connected", "ha_state", "panorama")}
     row |= {
@@ -189,81 +295,263 @@ def collect(dev: dict, creds: tuple[str, str]):
         "logging_service": "no",
         "device_certificate": "",
         "device_cert_exp": "",
-        # disk_*_pct added below
+        # disk_*_pct added by p_disk_files
     }
-    ip = row["ip"]
-    if not ip:
-        return row
+    return row
 
-    api_key = fw_key(ip, user, pw)   # ← per-device key only
-    if not api_key:
-        print(f"[API] skip {ip} – no valid key")
-        return row
+def run_commands(dev: dict, creds: tuple[str, str], commands=_COMMANDS,
+                 deadline: float | None = None, ts: str | None = None,
+                 by_label: dict | None = None) -> dict:
+    """Run `commands` (rows of _COMMANDS) against one device; merged parser output only.
 
-    def _api(cmd):
-        return api_get(ip, api_key, cmd)
+    Commands not started by `deadline` (time.monotonic()) are skipped, and so is
+    everything after the first connect error / timeout (see collector.breaker).
+    With XML_ARCHIVE on, the raw responses are archived under `ts`, the row timestamp.
+    `by_label`, if given, receives label -> parser output for every command that succeeded.
+    """
+    user, pw = creds
+    ip     = dev.get("ip", "")
+    serial = dev.get("serial", "")
+    if COLLECT_DISCONNECTED == "skip" and str(dev.get("connected", "")).lower() == "no":
+        return {}
+    via = dev.get("panorama_ip") if COLLECT_VIA_PANORAMA else None
+    if via and serial:
+        # Panorama key + pooled Panorama connection; the firewall IP needn't be routable
+        host, target = via, serial
+    elif ip:
+        host, target = ip, None
+    else:
+        return {}
 
-    try:
-        row |= p_session(_api("<show><session><info></info></session></show>"))
-    except Exception as e:
-        print(f"[API] session {ip} – {e}")
+    who = serial or ip
+    if not breaker.allow(who):
+        print(f"[API] skip {ip or target} – breaker open")
+        return {}
 
     try:
-        row |= p_system(_api("<show><system><info></info></system></show>"))
+        # per-device key, or the (cached) Panorama key
+        api_key = key_cache.get_key(host, user, pw)
+    except transport.NETWORK_ERRORS as e:
+        if not target:   # a Panorama hiccup says nothing about the firewall
+            print(f"[API] {ip} unreachable – breaker open {breaker.record_failure(who):.0f}s ({e})")
+        else:
+            print(f"[!] keygen {host} – {e}")
+        return {}
     except Exception as e:
-        print(f"[API] sys-info {ip} – {e}")
+        print(f"[!] keygen {host} – {e}")
+        print(f"[API] skip {ip or target} – no valid key")
+        return {}
 
-    try:
-        row |= p_resources(_api("<show><system><resources></resources></system></show>"))
-    except Exception as e:
-        print(f"[API] resources {ip} – {e}")
+    down    = threading.Event()          # set on the first connect error / timeout
+    ok      = threading.Event()
+    raw: dict[str, str] = {}             # label -> XML, for collector.archive
 
-    try:
-        row |= p_disk_files(
-            _api("<show><system><disk-space><files></files></disk-space></system></show>")
-        )
-    except Exception as e:
-        print(f"[API] disk-files {ip} – {e}")
+    def _get(key, label, cmd):
+        t0 = time.monotonic()
+        timeout = breaker.timeout_for(who, label)   # this command's observed latency on this device
+        try:
+            text = api_get(host, key, cmd, target, timeout)
+        except transport.NETWORK_ERRORS as e:
+            if not (isinstance(e, requests.ReadTimeout) and timeout[1] < transport.READ_TIMEOUT):
+                down.set()
+                raise
+            # connected but slower than usual: one retry at the transport default before
+            # calling the device down
+            try:
+                text = api_get(host, key, cmd, target)
+            except transport.NETWORK_ERRORS:
+                down.set()
+                raise
+        breaker.observe(who, label, time.monotonic() - t0)
+        ok.set()
+        return text
+
+    def _api(label, cmd):
+        nonlocal api_key
+        with _limited(_device_slots, target or ip, COLLECT_PER_DEVICE):
+            key = api_key
+            try:
+                return _get(key, label, cmd)
+            except pan_connect.AuthError:
+                # stale/revoked key: drop it, regenerate once, retry
+                key_cache.invalidate(host, key)
+                api_key = fw_key(host, user, pw)
+                if not api_key:
+                    raise
+                return _get(api_key, label, cmd)
+
+    def _run(label, cmd, parser):
+        if down.is_set():
+            return {}   # device stopped answering; don't wait out every timeout
+        if deadline is not None and time.monotonic() > deadline:
+            print(f"[API] {label} {ip or target} – skipped, past deadline")
+            return {}
+        # each command fails on its own; a bad parser never sinks the row
+        try:
+            xml = _api(label, cmd)
+            if archive.XML_ARCHIVE:
+                raw[label] = xml   # kept even if the parser chokes on it
+            return parser(xml)
+        except Exception as e:
+            print(f"[API] {label} {ip or target} – {e}")
+            return {}
+
+    if COLLECT_PER_DEVICE > 1 and len(commands) > 1:
+        # fan out; the per-device semaphore in _api keeps the mgmt plane capped
+        with ThreadPoolExecutor(max_workers=min(COLLECT_PER_DEVICE, len(commands)),
+                                thread_name_prefix=f"cmd-{ip}") as pool:
+            parts = list(pool.map(lambda c: _run(*c), commands))
+    else:
+        parts = [_run(*c) for c in commands]
+
+    if down.is_set():
+        print(f"[API] {ip or target} unreachable – breaker open {breaker.record_failure(who):.0f}s")
+    elif ok.is_set():
+        breaker.record_success(who)
+    archive.store(dev, ts or datetime.now(timezone.utc).isoformat(timespec="seconds"), raw)
+
+    if by_label is not None:
+        by_label.update((c[0], part) for c, part in zip(commands, parts) if part)
+    out: dict = {}
+    for part in parts:   # merge in table order so the row layout never changes
+        out |= part
+    return out
 
-    try:
-        row |= p_logging(
-            _api("<request><logging-service-forwarding><status></status></logging-service-forwarding></request>")
-        )
-    except Exception as e:
-        print(f"[API] logging-service {ip} – {e}")
+def collect(dev: dict, creds: tuple[str, str]):
+    """Use a per-device key, unless COLLECT_VIA_PANORAMA relays through `panorama_ip`."""
+    row = _base_row(dev)
+    return row | run_commands(dev, creds, ts=row["timestamp"])
+
+# ───────────── fleet collector ─────────────
+def _iter_fleet(devices: list[dict], creds: tuple[str, str],
+                workers: int | None = None, per_panorama: int | None = None):
+    """Yield (index, row) as each device finishes."""
+    workers      = COLLECT_WORKERS if workers is None else workers
+    per_panorama = COLLECT_PER_PANORAMA if per_panorama is None else per_panorama
+    # interleave Panoramas so a capped one can't park every worker on its semaphore;
+    # devices Panorama reports as disconnected go last (serial runs too)
+    by_pano: dict[str, list[int]] = {}
+    for i, d in enumerate(devices):
+        by_pano.setdefault(d.get("panorama") or "", []).append(i)
+    order = [i for grp in zip_longest(*by_pano.values()) for i in grp if i is not None]
+    order.sort(key=lambda i: str(devices[i].get("connected", "")).lower() == "no")
+
+    if workers <= 1 or len(devices) <= 1:
+        for i in order:
+            yield i, collect(devices[i], creds)
+        return
+
+    def _one(d):
+        with _limited(_pano_slots, d.get("panorama") or "", per_panorama):
+            return collect(d, creds)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collect") as pool:
+        futs = {pool.submit(_one, devices[i]): i for i in order}
+        for fut in as_completed(futs):
+            yield futs[fut], fut.result()
+
+def iter_fleet(devices: list[dict], creds: tuple[str, str], **limits):
+    """collect() every device on a bounded worker pool, yielding rows as they finish."""
+    for _, row in _iter_fleet(devices, creds, **limits):
+        yield row
+
+def collect_fleet(devices: list[dict], creds: tuple[str, str],
+                  workers: int | None = None,
+                  per_panorama: int | None = None) -> list[dict]:
+    """collect() every device on a bounded worker pool; rows keep input order.
+
+    `workers` caps the whole sweep, `per_panorama` caps devices in flight behind
+    one Panorama and COLLECT_PER_DEVICE caps API calls in flight per device.
+    """
+    rows: list[dict | None] = [None] * len(devices)
+    for i, row in _iter_fleet(devices, creds, workers, per_panorama):
+        rows[i] = row
+    return rows
 
+# ───────────── main ─────────────
+def load_inventory(cfg: dict, creds: tuple[str, str],
+                   errors: dict[str, str] | None = None) -> list[dict]:
+    """Managed devices of every Panorama in `cfg`, tagged with panorama / panorama_ip.
+
+    Panoramas are polled concurrently and the result is cached (collector/inventory.py);
+    Panoramas that fail keep their cached devices and their error goes into `errors`.
+    """
+    # Panorama is used for inventory; its key is reused for device calls only
+    # when COLLECT_VIA_PANORAMA is set
+    return inventory.refresh(cfg, creds, errors)[0]
+
+# a row with none of these came back with no data at all (unreachable, breaker open, bad key)
+_DATA_FIELDS = ("pan_os_version", "model", "cpu_one_min", "session_count")
+
+def _write_sweep_stats(started: datetime, t0: float, cfg: dict,
+                       stats: dict[str, dict], errors: dict[str, str]) -> None:
+    """Per-Panorama sweep outcome → sweep_stats, when there is a database to write to."""
+    if not os.getenv("DATABASE_URL"):
+        return
+    now = time.monotonic()
+    sweeps = [{"panorama": name,
+               "duration_secs": round(stats.get(name, {}).get("done", now) - t0, 1),
+               "devices_seen": stats.get(name, {}).get("seen", 0),
+               "devices_failed": stats.get(name, {}).get("failed", 0),
+               "error": (errors.get(name) or "")[:512] or None}
+              for name in {p["name"] for p in cfg["panoramas"]} | set(stats)]
     try:
-        row |= p_device_cert(
-            _api("<show><device-certificate><status></status></device-certificate></show>")
-        )
+        from collector.db_write import write_sweep_stats   # needs sqlalchemy; only when used
+        write_sweep_stats(started, sweeps)
     except Exception as e:
-        print(f"[API] device-cert {ip} – {e}")
+        print(f"[!] sweep stats not recorded – {e}")
 
-    return row
-
-# ───────────── main ─────────────
 def main():
     cfg = load_config()
     user, pw = cfg["credentials"].values()
+    started, t0 = datetime.now(timezone.utc), time.monotonic()
+    errors: dict[str, str] = {}
+
+    # start from the cached inventory and refresh it alongside the sweep;
+    # devices the refresh adds (or re-addresses) are collected at the end
+    devices = inventory.cached(cfg)
+    fresh: list[dict] = []
+    refresher = None
+    if devices:
+        print(f"[inventory] {len(devices)} cached devices – refreshing in the background")
+        refresher = threading.Thread(
+            target=lambda: fresh.extend(load_inventory(cfg, (user, pw), errors)),
+            name="inventory", daemon=True)
+        refresher.start()
+    else:
+        devices = load_inventory(cfg, (user, pw), errors)
 
-    devices  : list[dict] = []
+    # rows stream straight into the sinks (db / csv / json) as devices finish
+    out = pipeline.open_pipeline()
+    stats: dict[str, dict] = {}
 
-    # Use Panorama ONLY to fetch inventory; do not reuse its key for device calls
-    for p in cfg["panoramas"]:
-        try:
-            pano_key = pan_connect.get_api_key(p["ip"], user, pw)
-            for d in get_devices.fetch_managed_devices(p["ip"], pano_key):
-                d["panorama"] = p["name"]
-                devices.append(d)
-        except Exception as e:
-            print(f"[!] panorama {p['name']} – {e}")
+    def _sweep(devs: list[dict]) -> None:
+        for row in iter_fleet(devs, (user, pw)):
+            out.put(row)
+            st = stats.setdefault(row.get("panorama") or "", {"seen": 0, "failed": 0})
+            st["seen"] += 1
+            st["failed"] += all(row.get(k) is None for k in _DATA_FIELDS)
+            st["done"] = time.monotonic()
 
-    rows = [collect(d, (user, pw)) for d in devices]   # no pano_key passed
-
-    df = pd.DataFrame(rows)
-    df.to_csv("device_metrics.csv", index=False)
-    df.to_json("device_metrics.json", orient="records", indent=2)
-    print(f"✅ device_metrics.csv / .json written – {len(df)} devices")
+    ok = False
+    try:
+        _sweep(devices)
+        if refresher:
+            refresher.join()
+            done = {(d.get("serial"), d.get("ip")) for d in devices}
+            late = [d for d in fresh if (d.get("serial"), d.get("ip")) not in done]
+            if late:
+                print(f"[inventory] collecting {len(late)} new / re-addressed devices")
+                _sweep(late)
+        ok = True
+    finally:
+        out.close(ok)
+        transport.close()
+        breaker.save()
+        _write_sweep_stats(started, t0, cfg, stats, errors)
+    print(f"✅ collected – {out.summary()}")
+    if out.db_failed:
+        sys.exit(3)   # the entrypoint falls back to ingesting the JSON snapshot
 
 if __name__ == "__main__":
     main()
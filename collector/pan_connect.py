@@ -1,12 +1,31 @@
-import requests
-import urllib3
 import xml.etree.ElementTree as ET
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from collector import transport
+
+class AuthError(Exception):
+    """The device rejected our API key (HTTP 403 or an invalid-key response)."""
+
+_AUTH_CODES = {"403", "16"}   # PAN-OS: 403 invalid credentials, 16 unauthorized
+
+def check_auth(response, host):
+    """Raise AuthError if `response` says the key is no good; return its text otherwise."""
+    if response.status_code == 403:
+        raise AuthError(f"HTTP 403 from {host}")
+    text = response.text
+    if 'status="error"' in text[:200]:
+        try:
+            tree = ET.fromstring(text)
+        except ET.ParseError:
+            return text
+        msg = " ".join((tree.findtext(".//msg") or "").split())
+        if tree.get("code") in _AUTH_CODES or "invalid credential" in msg.lower() \
+                or "invalid key" in msg.lower():
+            raise AuthError(f"{host}: {msg or 'invalid key'}")
+    return text
 
 def get_api_key(pano_ip, username, password):
-    url = f"https://{pano_ip}/api/?type=keygen&user={username}&password={password}"
-    response = requests.get(url, verify=False, timeout=10)
+    params = {"type": "keygen", "user": username, "password": password}
+    response = transport.get(pano_ip, params)
 
     if response.status_code != 200:
         raise Exception(f"HTTP error {response.status_code} from {pano_ip}")
@@ -0,0 +1,192 @@
+# collector/pipeline.py
+"""
+Streaming sinks for collector rows.
+
+Rows are handed over as soon as each device finishes:
+  • db   – bounded queue → background thread → write_records_bulk() in batches
+  • csv  – device_metrics.csv, appended row by row
+  • json – device_metrics.json, a JSON array appended row by row
+File sinks write to a temp name and are renamed on close, so the ingest step
+never reads a half-written snapshot; a sweep that fails aborts them instead,
+which deletes the temp file. A db batch that fails is retried DB_RETRIES times.
+"""
+import csv, json, os, queue, threading, time
+from pathlib import Path
+
+COLLECT_SINKS     = os.getenv("COLLECT_SINKS", "csv,json")   # any of: db, csv, json
+METRICS_CSV_PATH  = os.getenv("METRICS_CSV_PATH", "device_metrics.csv")
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "device_metrics.json")
+DB_BATCH          = int(os.getenv("DB_BATCH", "200"))          # rows per INSERT batch
+DB_FLUSH_SECS     = float(os.getenv("DB_FLUSH_SECS", "5"))     # max age of a partial batch
+DB_QUEUE_MAX      = int(os.getenv("DB_QUEUE_MAX", "1000"))     # back-pressure on collectors
+DB_RETRIES        = int(os.getenv("DB_RETRIES", "3"))          # extra attempts for a failed batch
+
+# fixed CSV header: collect()'s row layout + the disk mounts the schema knows
+CSV_FIELDS = [
+    "hostname", "serial", "ip", "connected", "ha_state", "panorama", "timestamp",
+    "pan_os_version", "model", "cpu_one_min", "memory_usage", "swap_used",
+    "session_count", "session_max", "logging_service",
+    "device_certificate", "device_cert_exp",
+    "disk_root_pct", "disk_dev_pct", "disk_opt_pancfg_pct", "disk_opt_panrepo_pct",
+    "disk_dev_shm_pct", "disk_cgroup_pct", "disk_opt_panlogs_pct",
+    "disk_opt_pancfg_mgmt_ssl_private_pct", "disk_opt_panraid_ld1_pct",
+]
+
+def sink_enabled(name: str) -> bool:
+    return name in {s.strip().lower() for s in COLLECT_SINKS.split(",")}
+
+class _FileSink:
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".part")
+        self._fh  = open(self._tmp, "w", newline="")
+        self.count = 0
+
+    def close(self) -> None:
+        self._fh.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._fh.close()
+        self._tmp.unlink(missing_ok=True)
+
+class CsvSink(_FileSink):
+    def __init__(self, path: str = METRICS_CSV_PATH):
+        super().__init__(path)
+        self._w = csv.DictWriter(self._fh, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        self._w.writeheader()
+
+    def put(self, row: dict) -> None:
+        self._w.writerow(row)
+        self.count += 1
+
+class JsonSink(_FileSink):
+    def __init__(self, path: str = METRICS_JSON_PATH):
+        super().__init__(path)
+        self._fh.write("[")
+
+    def put(self, row: dict) -> None:
+        self._fh.write(("\n  " if not self.count else ",\n  ") + json.dumps(row, default=str))
+        self.count += 1
+
+    def close(self) -> None:
+        self._fh.write("\n]\n")
+        super().close()
+
+class DbSink:
+    """Batching Postgres writer fed through a bounded queue."""
+    _STOP = object()
+
+    def __init__(self, batch: int = DB_BATCH, flush_secs: float = DB_FLUSH_SECS,
+                 maxsize: int = DB_QUEUE_MAX, retries: int = DB_RETRIES,
+                 on_written=None, on_failed=None):
+        from collector.db_write import write_records_bulk   # DB deps only when this sink is on
+        self._write     = write_records_bulk
+        self.batch      = batch
+        self.flush_secs = flush_secs
+        self.retries    = retries
+        self.on_written = on_written   # called with each batch once it is committed
+        self.on_failed  = on_failed    # … or once it has run out of retries
+        self.inserted = self.skipped = self.failed = 0
+        self._q = queue.Queue(maxsize=maxsize)
+        self._t = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._t.start()
+
+    def put(self, row: dict) -> None:
+        self._q.put(row)   # blocks when the writer falls behind
+
+    def _flush(self, buf: list) -> None:
+        if not buf:
+            return
+        for attempt in range(self.retries + 1):
+            try:
+                res = self._write(buf)
+            except Exception as e:
+                if attempt < self.retries:
+                    print(f"[db] batch of {len(buf)} failed – {e} – retrying")
+                    time.sleep(2 ** attempt)
+                    continue
+                self.failed += len(buf)
+                print(f"[db] batch of {len(buf)} failed – {e}")
+                self._hook(self.on_failed, buf)
+            else:
+                self.inserted += res.inserted
+                self.skipped  += res.skipped
+                self._hook(self.on_written, buf)
+            break
+        buf.clear()
+
+    @staticmethod
+    def _hook(fn, buf: list) -> None:
+        if fn:
+            try:
+                fn(list(buf))
+            except Exception as e:
+                print(f"[db] {fn.__name__} – {e}")
+
+    def _run(self) -> None:
+        buf: list = []
+        deadline = time.monotonic() + self.flush_secs
+        while True:
+            try:
+                item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._flush(buf)
+                return
+            if item is not None:
+                buf.append(item)
+            if len(buf) >= self.batch or time.monotonic() >= deadline:
+                self._flush(buf)
+                deadline = time.monotonic() + self.flush_secs
+
+    def close(self) -> None:
+        self._q.put(self._STOP)
+        self._t.join()
+
+    abort = close   # rows already collected are still good
+
+class Pipeline:
+    """Fan each finished row out to every enabled sink."""
+
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+        self.count = 0
+
+    def put(self, row: dict) -> None:
+        for s in self.sinks:
+            s.put(row)
+        self.count += 1
+
+    def close(self, ok: bool = True) -> None:
+        """Finish every sink; with ok=False file sinks are discarded instead of published."""
+        for s in self.sinks:
+            try:
+                s.close() if ok else s.abort()
+            except Exception as e:
+                print(f"[pipeline] closing {type(s).__name__} – {e}")
+
+    @property
+    def db_failed(self) -> int:
+        """Rows a DbSink gave up on after its retries."""
+        return sum(s.failed for s in self.sinks if isinstance(s, DbSink))
+
+    def summary(self) -> str:
+        parts = [f"{self.count} devices"]
+        for s in self.sinks:
+            if isinstance(s, DbSink):
+                parts.append(f"db +{s.inserted} ({s.skipped} dup, {s.failed} failed)")
+            else:
+                parts.append(str(s.path))
+        return " – ".join(parts)
+
+def open_pipeline() -> Pipeline:
+    sinks: list = []
+    if sink_enabled("db"):
+        sinks.append(DbSink())
+    if sink_enabled("csv"):
+        sinks.append(CsvSink())
+    if sink_enabled("json"):
+        sinks.append(JsonSink())
+    return Pipeline(sinks)
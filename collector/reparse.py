@@ -0,0 +1,90 @@
+# collector/reparse.py
+"""
+Offline re-parse of the raw XML archive  (collector/archive.py)
+
+Replays archived op-command responses through the current parsers and
+backfills Postgres through the bulk ingest path, without contacting any
+firewall. Archive files are parsed in parallel worker processes; rows are
+written in INGEST_BULK_CHUNK batches with write_records_bulk(backfill=True),
+so an existing snapshot (same device and timestamp) gets the re-parsed values
+and a missing one is inserted.
+
+    python -m collector.reparse --since 2026-09-01 --serial 013201000123 --workers 8
+    python -m collector.reparse --dry-run        # parse only, print a sample row
+"""
+import argparse, os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from collector import archive
+
+def _parsers() -> dict:
+    from collector import metrics_collector as mc
+    return {label: parser for label, _, parser in mc._COMMANDS}
+
+def parse_file(path: str) -> tuple[list[dict], int]:
+    """Rows rebuilt from one archive file, plus the number of parser failures."""
+    parsers = _parsers()
+    rows, failed = [], 0
+    for entry in archive.read(Path(path)):
+        row = {**entry.get("dev", {}), "timestamp": entry["ts"]}
+        for label, xml in (entry.get("xml") or {}).items():
+            parser = parsers.get(label)
+            if parser is None:
+                continue   # command since removed from _COMMANDS
+            try:
+                row |= parser(xml)
+            except Exception as e:
+                failed += 1
+                print(f"[reparse] {path} {entry['ts']} {label} – {e}")
+        rows.append(row)
+    return rows, failed
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-parse the raw XML archive into Postgres.")
+    ap.add_argument("--since", type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    ap.add_argument("--until", type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    ap.add_argument("--serial", action="append", help="only this device (repeatable)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    ap.add_argument("--dry-run", action="store_true", help="parse only, write nothing")
+    args = ap.parse_args()
+
+    paths = archive.files(args.since, args.until, set(args.serial or ()))
+    print(f"[reparse] {len(paths)} archive files in {archive.XML_ARCHIVE_DIR}")
+    if not paths:
+        return
+
+    write = None
+    if not args.dry_run:
+        from collector.db_write import BULK_CHUNK, write_records_bulk   # DB deps only when writing
+        write = lambda batch: write_records_bulk(batch, backfill=True)
+    chunk = BULK_CHUNK if write else 0
+
+    buf: list[dict] = []
+    rows = failed = inserted = updated = 0
+    sample = None
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for file_rows, file_failed in pool.map(parse_file, map(str, paths), chunksize=4):
+            rows += len(file_rows)
+            failed += file_failed
+            sample = sample or (file_rows[:1] or [None])[0]
+            if not write:
+                continue
+            buf += file_rows
+            while len(buf) >= chunk:
+                res = write(buf[:chunk])
+                inserted, updated = inserted + res.inserted, updated + res.updated
+                del buf[:chunk]
+        if write and buf:
+            res = write(buf)
+            inserted, updated = inserted + res.inserted, updated + res.updated
+
+    print(f"[reparse] {rows} rows, {failed} parser failures")
+    if write:
+        print(f"[reparse] backfilled – {inserted} inserted, {updated} updated")
+    elif sample:
+        print(f"[reparse] sample: {sample}")
+
+if __name__ == "__main__":
+    main()
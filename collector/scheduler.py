@@ -0,0 +1,193 @@
+# collector/scheduler.py
+"""
+Long-running collector daemon  (COLLECT_MODE=daemon)
+
+Instead of one sweep every COLLECT_INTERVAL, every parser gets its own cadence:
+
+    cadence:              # config.yaml, seconds
+      p_resources: 60
+      p_session: 60
+      p_device_cert: 86400
+
+Each device gets a random phase so load spreads evenly across the period. A
+device's first visit runs every command, so no row ever carries placeholders
+for metrics that haven't been collected yet; after that each command keeps its
+phase within its own cadence. Commands that fall due together are sent in one visit, a visit is cut off at
+its deadline (the shortest due cadence), and a device is never visited while
+its previous visit is still running. Every visit emits a full row: metrics of
+commands not due this time are carried forward from the device's last visit,
+while a due command that failed or was skipped reads as missing, like in a
+sweep, never as its previous value.
+
+The daemon starts on the cached inventory (collector/inventory.py) and a
+background thread refreshes it every INVENTORY_INTERVAL seconds.
+"""
+import heapq, os, random, signal, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from collector.config_loader import load_config
+from collector import breaker, inventory, metrics_collector as mc, pipeline, transport
+
+INVENTORY_INTERVAL = int(os.getenv("INVENTORY_INTERVAL", os.getenv("COLLECT_INTERVAL", "3600")))
+COALESCE_SECS      = float(os.getenv("SCHED_COALESCE_SECS", "2"))   # batch commands due this close
+
+DEFAULT_CADENCE = {
+    "p_resources":   60,
+    "p_session":     60,
+    "p_system":      3600,
+    "p_disk_files":  900,
+    "p_logging":     900,
+    "p_device_cert": 86400,
+}
+
+def _key(dev: dict) -> str:
+    return dev.get("serial") or dev.get("ip") or ""
+
+class _DeviceState:
+    __slots__ = ("dev", "due", "spread", "running", "last", "slot")
+
+    def __init__(self, dev: dict, cadence: dict[str, int], now: float):
+        self.dev     = dev
+        phase        = random.random()          # same phase for all of this device's commands
+        first        = now + phase * min(cadence[c[2].__name__] for c in mc._COMMANDS)
+        self.due     = {c[0]: first for c in mc._COMMANDS}    # first visit: everything
+        self.spread: dict | None = {c[0]: now + phase * cadence[c[2].__name__] for c in mc._COMMANDS}
+        self.running = False
+        self.last: dict[str, dict] = {}         # label -> last successful parser output
+        self.slot    = 0.0                      # due time of this device's live heap entry
+
+    def next_due(self) -> float:
+        return min(self.due.values())
+
+class Scheduler:
+    def __init__(self, cfg: dict, workers: int = mc.COLLECT_WORKERS):
+        user, pw     = cfg["credentials"].values()
+        self.cfg     = cfg
+        self.creds   = (user, pw)
+        self.cadence = DEFAULT_CADENCE | {k: int(v) for k, v in (cfg.get("cadence") or {}).items()}
+        self.pool    = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="visit")
+        self.out     = pipeline.Pipeline([pipeline.DbSink()])
+        self.devices: dict[str, _DeviceState] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.refresher: inventory.Refresher | None = None
+
+    # ── inventory ──
+    def apply_inventory(self, devices: list[dict], changes=()) -> None:
+        """Track exactly `devices`: new ones get a phase, vanished ones are dropped."""
+        now = time.time()
+        found = {_key(d): d for d in devices if _key(d)}
+        with self._lock:
+            for k in list(self.devices):
+                if k not in found:
+                    del self.devices[k]
+            for k, d in found.items():
+                st = self.devices.get(k)
+                if st:
+                    st.dev = d
+                else:
+                    st = self.devices[k] = _DeviceState(d, self.cadence, now)
+                    self._push(k, st)
+        print(f"[sched] inventory – {len(found)} devices")
+        self._wake.set()
+
+    def _push(self, k: str, st: _DeviceState) -> None:
+        st.slot = st.next_due()
+        heapq.heappush(self._heap, (st.slot, k))
+
+    # ── one visit ──
+    def _visit(self, st: _DeviceState, commands, deadline: float) -> None:
+        dev = st.dev
+        try:
+            base = mc._base_row(dev)
+            fresh: dict[str, dict] = {}
+            with mc._limited(mc._pano_slots, dev.get("panorama") or "", mc.COLLECT_PER_PANORAMA):
+                mc.run_commands(dev, self.creds, commands, deadline, ts=base["timestamp"], by_label=fresh)
+            for c in commands:   # due: the new reading, or nothing if it failed / was skipped
+                if c[0] in fresh:
+                    st.last[c[0]] = fresh[c[0]]
+                else:
+                    st.last.pop(c[0], None)
+            row = base
+            for c in mc._COMMANDS:   # table order, as run_commands merges
+                row |= st.last.get(c[0], {})
+            self.out.put(row)
+        except Exception as e:
+            print(f"[sched] visit {_key(dev)} – {e}")
+        finally:
+            with self._lock:
+                st.running = False
+
+    def _dispatch(self, k: str, t: float, now: float) -> None:
+        with self._lock:
+            st = self.devices.get(k)
+            if st is None or st.slot != t:
+                return                              # dropped from inventory / stale entry
+            due = [c for c in mc._COMMANDS if st.due[c[0]] <= now + COALESCE_SECS]
+            for c in due:
+                period = self.cadence[c[2].__name__]
+                slot = st.due[c[0]] + period
+                if st.spread and st.spread[c[0]] > now + COALESCE_SECS:
+                    slot = st.spread[c[0]]          # after the first visit: back to this command's phase
+                if slot <= now:                     # fell behind: skip to the next future slot
+                    slot += ((now - slot) // period + 1) * period
+                st.due[c[0]] = slot
+            st.spread = None
+            self._push(k, st)
+            if st.running:
+                print(f"[sched] {k} still running – skipping {len(due)} due command(s)")
+                return
+            st.running = True
+        deadline = time.monotonic() + min(self.cadence[c[2].__name__] for c in due)
+        self.pool.submit(self._visit, st, due, deadline)
+
+    # ── main loop ──
+    def run(self) -> None:
+        # start on the cached inventory; the refresher swaps in live lists as they change
+        cached = inventory.cached(self.cfg)
+        if cached:
+            self.apply_inventory(cached)
+        self.refresher = inventory.Refresher(self.cfg, self.creds, INVENTORY_INTERVAL,
+                                             on_change=self.apply_inventory).start()
+        next_save = 0.0
+        while not self._stop.is_set():
+            now = time.time()
+            if now >= next_save:
+                breaker.save()
+                next_save = now + INVENTORY_INTERVAL
+            with self._lock:
+                ready = []
+                while self._heap and self._heap[0][0] <= now:
+                    ready.append(heapq.heappop(self._heap))
+                wait = (self._heap[0][0] - now) if self._heap else INVENTORY_INTERVAL
+            for t, k in ready:
+                self._dispatch(k, t, now)
+            self._wake.clear()
+            self._wake.wait(max(0.05, min(wait, next_save - time.time())))
+
+    def stop(self, *_):
+        self._stop.set()
+        self._wake.set()
+
+    def close(self) -> None:
+        if self.refresher:
+            self.refresher.stop()
+        self.pool.shutdown(wait=True)
+        self.out.close()
+        transport.close()
+        breaker.save()
+
+def main():
+    sched = Scheduler(load_config())
+    signal.signal(signal.SIGTERM, sched.stop)
+    signal.signal(signal.SIGINT, sched.stop)
+    print(f"[sched] daemon up – cadence {sched.cadence}")
+    try:
+        sched.run()
+    finally:
+        sched.close()
+
+if __name__ == "__main__":
+    main()
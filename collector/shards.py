@@ -0,0 +1,182 @@
+# collector/shards.py
+"""
+Horizontally sharded collector  (COLLECT_MODE=sharded)
+
+Run any number of replicas against the same Postgres; they split the fleet
+through the collector_leases table (db/leases.py) and need nothing else:
+
+    docker compose up -d --scale collector=4
+
+Each replica keeps COLLECT_WORKERS devices in flight. When a worker frees up
+it claims more due devices (FOR UPDATE SKIP LOCKED), collects them exactly as
+a sweep would and streams the rows into Postgres; a device is marked collected
+only once the batch holding its row has committed. A device is due again
+SHARD_INTERVAL seconds after its last collection, so no device is collected
+twice per interval however many replicas run, and a crashed replica's devices
+are picked up once their SHARD_LEASE_SECS lease lapses. A visit or write that
+fails puts the device on hold for SHARD_RETRY_SECS rather than straight back in
+the queue. Inventory is refreshed by whichever replica finds it
+INVENTORY_INTERVAL old first.
+"""
+import os, signal, socket, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from collector.config_loader import load_config
+from collector import breaker, metrics_collector as mc, pipeline, transport
+from db import leases
+from db.database import engine
+from db.models import CollectorLease
+
+SHARD_INTERVAL     = float(os.getenv("SHARD_INTERVAL", os.getenv("COLLECT_INTERVAL", "3600")))
+SHARD_LEASE_SECS   = float(os.getenv("SHARD_LEASE_SECS", "300"))   # renewed while a device is in flight
+SHARD_POLL_SECS    = float(os.getenv("SHARD_POLL_SECS", "10"))     # idle wait before claiming again
+SHARD_RETRY_SECS   = float(os.getenv("SHARD_RETRY_SECS", "60"))    # hold-off after a failed visit / write
+INVENTORY_INTERVAL = float(os.getenv("INVENTORY_INTERVAL", os.getenv("COLLECT_INTERVAL", "3600")))
+
+class ShardWorker:
+    def __init__(self, cfg: dict, workers: int = mc.COLLECT_WORKERS):
+        user, pw     = cfg["credentials"].values()
+        self.cfg     = cfg
+        self.creds   = (user, pw)
+        self.workers = max(1, workers)
+        self.owner   = f"{socket.gethostname()}:{os.getpid()}"
+        self.pool    = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+        self.out     = pipeline.Pipeline([pipeline.DbSink(on_written=self._written,
+                                                          on_failed=self._unwritten)])
+        self.inflight: set[str] = set()
+        self.pending: set[str] = set()   # collected, row not committed yet
+        self.collected = self.lost = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    # ── inventory ──
+    def refresh_inventory(self) -> None:
+        """Reload Panorama inventory into collector_leases, if it's due and nobody else is on it."""
+        with leases.inventory_lock(engine) as mine:
+            if not mine:
+                return
+            with engine.begin() as conn:
+                if not leases.inventory_due(conn, INVENTORY_INTERVAL):
+                    return
+            errors: dict[str, str] = {}
+            devices = mc.load_inventory(self.cfg, self.creds, errors)   # no transaction open
+            with engine.begin() as conn:
+                n = leases.sync_inventory(conn, devices, failed=errors)
+        print(f"[shard] inventory – {n} devices" + (f", {len(errors)} Panorama(s) failed" if errors else ""))
+
+    # ── one device ──
+    def _visit(self, dev: dict) -> None:
+        serial = dev.get("serial", "")
+        try:
+            with mc._limited(mc._pano_slots, dev.get("panorama") or "", mc.COLLECT_PER_PANORAMA):
+                row = mc.collect(dev, self.creds)
+            with self._lock:
+                self.pending.add(serial)
+            self.out.put(row)   # the lease is completed by _written once the batch commits
+        except Exception as e:
+            print(f"[shard] visit {serial} – {e}")
+            self._backoff([serial])
+        finally:
+            with self._lock:
+                self.inflight.discard(serial)
+            self._wake.set()
+
+    # ── DbSink hooks (db-writer thread) ──
+    def _written(self, rows: list[dict]) -> None:
+        serials = [r["serial"] for r in rows if r.get("serial")]
+        try:
+            with engine.begin() as conn:
+                done = leases.complete(conn, self.owner, serials)
+        finally:
+            with self._lock:
+                self.pending.difference_update(serials)
+        with self._lock:
+            self.collected += done
+            self.lost += len(serials) - done
+        if done < len(serials):
+            print(f"[shard] {len(serials) - done} lease(s) lapsed before the write (raise SHARD_LEASE_SECS)")
+
+    def _unwritten(self, rows: list[dict]) -> None:
+        serials = [r["serial"] for r in rows if r.get("serial")]
+        with self._lock:
+            self.pending.difference_update(serials)
+        self._backoff(serials)
+
+    def _backoff(self, serials: list[str]) -> None:
+        try:
+            with engine.begin() as conn:
+                leases.backoff(conn, self.owner, serials, SHARD_RETRY_SECS)
+        except Exception:
+            pass   # the lease runs out on its own
+
+    def _claim(self) -> int:
+        with self._lock:
+            free = self.workers - len(self.inflight)
+        if free <= 0:
+            return 0
+        with engine.begin() as conn:
+            devices = leases.claim(conn, self.owner, free, SHARD_INTERVAL, SHARD_LEASE_SECS)
+        with self._lock:
+            self.inflight.update(d["serial"] for d in devices)
+        for d in devices:
+            self.pool.submit(self._visit, d)
+        return len(devices)
+
+    def _renew(self) -> None:
+        with self._lock:
+            serials = list(self.inflight | self.pending)
+        if serials:
+            with engine.begin() as conn:
+                leases.renew(conn, self.owner, serials, SHARD_LEASE_SECS)
+
+    # ── main loop ──
+    def run(self) -> None:
+        next_inventory = next_renew = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            try:
+                if now >= next_inventory:
+                    self.refresh_inventory()
+                    breaker.save()
+                    next_inventory = now + min(INVENTORY_INTERVAL, 60)
+                if now >= next_renew:
+                    self._renew()
+                    next_renew = now + SHARD_LEASE_SECS / 3
+                claimed = self._claim()
+            except Exception as e:
+                print(f"[shard] lease table unavailable – {e}")
+                claimed = 0
+            if not claimed:
+                self._wake.clear()
+                self._wake.wait(min(SHARD_POLL_SECS, max(0.05, next_renew - time.monotonic())))
+
+    def stop(self, *_):
+        self._stop.set()
+        self._wake.set()
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        self.out.close()   # flushes the last batch, completing its leases
+        try:
+            with engine.begin() as conn:
+                leases.release(conn, self.owner)
+        except Exception as e:
+            print(f"[shard] releasing leases – {e}")
+        transport.close()
+        breaker.save()
+        print(f"[shard] {self.owner} stopped – {self.collected} collected, {self.lost} lapsed")
+
+def main():
+    CollectorLease.__table__.create(engine, checkfirst=True)
+    worker = ShardWorker(load_config())
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    print(f"[shard] {worker.owner} up – {worker.workers} workers, interval {SHARD_INTERVAL:.0f}s")
+    try:
+        worker.run()
+    finally:
+        worker.close()
+
+if __name__ == "__main__":
+    main()
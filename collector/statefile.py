@@ -0,0 +1,25 @@
+# collector/statefile.py
+"""
+Atomic writes for the collector's state files in /data
+(inventory.json, breaker.json, api_keys.enc).
+
+The temp file is named per host, process and thread: sharded replicas share
+/data, and with one fixed .tmp name a replica could rename another's
+half-written file into place.
+"""
+import os, socket, threading
+from pathlib import Path
+
+def write_atomic(path: Path, data: bytes, mode: int | None = None) -> None:
+    """Replace `path` with `data`; readers see the old file or the new one, never a mix."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            if mode is not None:
+                os.fchmod(fh.fileno(), mode)   # before the data lands
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
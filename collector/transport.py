@@ -0,0 +1,68 @@
+# collector/transport.py
+"""
+Shared keep-alive HTTPS transport for PAN-OS XML-API calls.
+
+One requests.Session (one urllib3 pool) per host, so every command against a
+firewall or Panorama rides an already-open TCP/TLS connection instead of paying
+a fresh handshake on the management plane.
+"""
+import atexit, os, threading
+import requests, urllib3
+from requests.adapters import HTTPAdapter
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+POOL_MAXSIZE    = int(os.getenv("PAN_POOL_MAXSIZE", "4"))        # connections kept per host
+CONNECT_TIMEOUT = float(os.getenv("PAN_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT    = float(os.getenv("PAN_READ_TIMEOUT", "10"))
+
+# "the box is not answering" – what the circuit breaker counts as a failure
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+class Transport:
+    def __init__(self, pool_maxsize: int = POOL_MAXSIZE,
+                 timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 verify: bool = False):
+        self.pool_maxsize = pool_maxsize
+        self.timeout      = timeout
+        self.verify       = verify
+        self._lock        = threading.Lock()
+        self._sessions: dict[str, requests.Session] = {}
+
+    def _session(self, host: str) -> requests.Session:
+        s = self._sessions.get(host)
+        if s is not None:
+            return s
+        with self._lock:
+            s = self._sessions.get(host)
+            if s is None:
+                s = requests.Session()
+                s.verify = self.verify
+                # block instead of opening throwaway connections when the pool is busy
+                s.mount("https://", HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=self.pool_maxsize,
+                                                pool_block=True))
+                self._sessions[host] = s
+            return s
+
+    def get(self, host: str, params: dict, timeout=None) -> requests.Response:
+        """GET https://<host>/api/ with `params` (URL-encoded for us)."""
+        return self._session(host).get(
+            f"https://{host}/api/", params=params, timeout=timeout or self.timeout,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for s in sessions:
+            s.close()
+
+# process-wide instance used by pan_connect, get_devices and metrics_collector
+_shared = Transport()
+atexit.register(_shared.close)
+
+def get(host: str, params: dict, timeout=None) -> requests.Response:
+    return _shared.get(host, params, timeout)
+
+def close() -> None:
+    _shared.close()
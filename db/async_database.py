@@ -0,0 +1,28 @@
+# db/async_database.py
+"""
+Async engine + sessions for the API's read endpoints (psycopg 3 in async mode).
+
+Same DATABASE_URL and pool sizing as db/database.py; reads additionally get
+  DB_STATEMENT_TIMEOUT_MS   server-side statement_timeout (0 = none)
+  DB_PREPARE_THRESHOLD      executions before psycopg prepares a statement
+                            server-side ("none" disables, e.g. behind pgbouncer
+                            in transaction mode)
+Ingest keeps using the sync engine.
+"""
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.database import DATABASE_URL, POOL_ARGS
+
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+_prepare = os.getenv("DB_PREPARE_THRESHOLD", "5").strip().lower()
+DB_PREPARE_THRESHOLD = None if _prepare in ("", "none", "off") else int(_prepare)
+
+_connect_args: dict = {"prepare_threshold": DB_PREPARE_THRESHOLD}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    _connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+async_engine = create_async_engine(DATABASE_URL, connect_args=_connect_args, **POOL_ARGS)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
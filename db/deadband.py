@@ -0,0 +1,215 @@
+# db/deadband.py
+"""
+Change-only storage for slowly changing snapshot fields  (INGEST_DEADBAND=1)
+
+With the mode on, ingest compares each DEADBAND_ATTRS field with the device's
+current value and each DEADBAND_NUMERIC metric with its last stored value:
+
+  • changed (or outside the band) → stored as usual and logged to
+    snapshot_attr_changes (device, attr, changed_at, value)
+  • unchanged (or inside the band) → stored as NULL and its bit set in
+    metric_snapshots.deadband_mask
+
+Readers put masked values back from the change log, so API output, trends,
+exports and rollups see full rows: filled() / filled_sql() for queries,
+fill_masked() for loaded MetricSnapshot objects. Rows written before the mode
+was switched on (mask NULL / 0) read as they always did.
+
+filled() / filled_sql() cost a correlated subquery per value and hide the
+column from its indexes, so they only do that when DEADBAND_READS is on
+(default: INGEST_DEADBAND); otherwise they are the plain column. Keep
+DEADBAND_READS=1 on readers after switching ingest back off while masked rows
+are still within retention.
+
+    INGEST_DEADBAND=1
+    DEADBAND_ATTRS=connected,ha_state,logging_service,device_certificate,device_cert_exp
+    DEADBAND_NUMERIC=disk_*_pct=0.5,swap_used=16      # <column glob>=<band>
+"""
+import fnmatch
+from datetime import datetime, timezone
+from os import getenv
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, case, cast, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db.models import MetricSnapshot, SnapshotAttrChange
+
+INGEST_DEADBAND = getenv("INGEST_DEADBAND", "0").lower() in ("1", "true", "yes")
+DEADBAND_READS  = getenv("DEADBAND_READS", str(INGEST_DEADBAND)).lower() in ("1", "true", "yes")
+DEADBAND_ATTRS  = [a.strip() for a in getenv(
+    "DEADBAND_ATTRS", "connected,ha_state,logging_service,device_certificate,device_cert_exp"
+).split(",") if a.strip()]
+DEADBAND_NUMERIC = dict(
+    (p.strip(), float(b)) for p, _, b in
+    (item.partition("=") for item in getenv("DEADBAND_NUMERIC", "").split(",") if item.strip())
+)
+
+# bit positions in deadband_mask – append only, existing rows depend on them
+MASKABLE = (
+    "connected", "ha_state", "logging_service", "device_certificate", "device_cert_exp",
+    "cpu_one_min", "memory_usage", "swap_used", "session_count", "session_max",
+    "disk_root_pct", "disk_dev_pct", "disk_opt_pancfg_pct", "disk_opt_panrepo_pct",
+    "disk_dev_shm_pct", "disk_cgroup_pct", "disk_opt_panlogs_pct",
+    "disk_opt_pancfg_mgmt_ssl_private_pct", "disk_opt_panraid_ld1_pct",
+)
+BIT = {name: 1 << i for i, name in enumerate(MASKABLE)}
+
+_DEVICE_LOCK_NS = 0x70616e64   # pg_advisory_xact_lock(ns, hashtext(device_id)), held until commit
+# taken in hash order, so two ingests never wait on each other's locks in a cycle
+_LOCK_DEVICES_SQL = text("""
+SELECT pg_advisory_xact_lock(:ns, h)
+  FROM (SELECT DISTINCT hashtext(d) AS h FROM unnest(CAST(:d AS text[])) AS d ORDER BY h) locks
+""")
+_TYPES = {name: MetricSnapshot.__table__.c[name].type for name in MASKABLE}
+
+def _band(name: str) -> Optional[float]:
+    """0 for exact-match attributes, the band for numeric ones, None if not deadbanded."""
+    if name in DEADBAND_ATTRS:
+        return 0.0
+    if isinstance(_TYPES[name], (Float, Integer)):
+        for pattern, band in DEADBAND_NUMERIC.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return band
+    return None
+
+def _naive(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+def _json(name: str, v):
+    """Snapshot value → what the change log stores (and compares)."""
+    t = _TYPES[name]
+    if isinstance(t, DateTime):
+        return _naive(v).isoformat() if isinstance(v, datetime) else str(v)
+    if isinstance(t, Integer):
+        return int(float(v))
+    if isinstance(t, Float):
+        return float(v)
+    return str(v)
+
+def _from_json(name: str, v):
+    return datetime.fromisoformat(v) if isinstance(_TYPES[name], DateTime) and v is not None else v
+
+def _same(a, b, band: float) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= band
+    return a == b
+
+# ───────────── ingest ─────────────
+def _current(conn, devices: List[str], attrs: List[str]):
+    """(last logged value per (device, attr), newest stored snapshot time per device)."""
+    state = {(r.device_id, r.attr): r.value for r in conn.execute(text("""
+        SELECT DISTINCT ON (device_id, attr) device_id, attr, value
+          FROM snapshot_attr_changes
+         WHERE device_id = ANY(:d) AND attr = ANY(:a)
+         ORDER BY device_id, attr, changed_at DESC
+    """), {"d": devices, "a": attrs})}
+    newest = dict(conn.execute(text(
+        "SELECT device_id, collected_at FROM device_latest WHERE device_id = ANY(:d)"), {"d": devices}).all())
+    return state, newest
+
+def apply(conn, snaps: List[Dict]) -> List[Dict]:
+    """Mask unchanged fields in `snaps` (dicts with device_id + column values), in place.
+
+    Returns the change-log rows to write along with them (see record()). Only rows
+    newer than the device's latest snapshot are compared; a late or duplicate row
+    is stored whole, since masking it (or logging it) would change what the rows
+    after it read back.
+    """
+    active = {name: band for name in MASKABLE if (band := _band(name)) is not None}
+    if not INGEST_DEADBAND or not active or not snaps:
+        return []
+    devices = sorted({s["device_id"] for s in snaps})
+    # one ingest per device at a time decides what changed; disjoint batches run in parallel
+    conn.execute(_LOCK_DEVICES_SQL, {"ns": _DEVICE_LOCK_NS, "d": devices})
+    state, newest = _current(conn, devices, list(active))
+    changes: List[Dict] = []
+    for s in sorted(snaps, key=lambda s: (s["device_id"], _naive(s["collected_at"]))):
+        dev, ts, mask = s["device_id"], _naive(s["collected_at"]), 0
+        s["deadband_mask"] = 0
+        if dev in newest and ts <= newest[dev]:
+            continue
+        newest[dev] = ts
+        for name, band in active.items():
+            if s.get(name) is None:             # missing stays NULL and unmasked
+                continue
+            try:
+                v = _json(name, s[name])
+            except (TypeError, ValueError):
+                continue
+            if (dev, name) in state and _same(v, state[(dev, name)], band):
+                s[name] = None
+                mask |= BIT[name]
+            else:
+                state[(dev, name)] = v
+                changes.append({"device_id": dev, "attr": name, "changed_at": s["collected_at"], "value": v})
+        s["deadband_mask"] = mask
+    return changes
+
+def record(conn, changes: List[Dict]) -> None:
+    if changes:
+        conn.execute(pg_insert(SnapshotAttrChange.__table__).values(changes).on_conflict_do_nothing())
+
+# ───────────── read ─────────────
+def filled(name: str):
+    """SQL expression for MetricSnapshot.<name> with a masked value read back from the log."""
+    col = getattr(MetricSnapshot, name)
+    if name not in BIT or not DEADBAND_READS:
+        return col
+    c = SnapshotAttrChange
+    logged = (
+        select(cast(c.value.op("#>>")(literal_column("'{}'")), _TYPES[name]))
+        .where(c.device_id == MetricSnapshot.device_id, c.attr == name,
+               c.changed_at <= MetricSnapshot.collected_at)
+        .order_by(c.changed_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return case((MetricSnapshot.deadband_mask.op("&")(BIT[name]) != 0, logged), else_=col).label(name)
+
+def filled_sql(name: str, alias: str = "s", pg_type: str = "float8") -> str:
+    """filled() as raw SQL over a metric_snapshots alias, for the text() queries."""
+    if name not in BIT or not DEADBAND_READS:
+        return f"{alias}.{name}::{pg_type}"
+    return (
+        f"CASE WHEN {alias}.deadband_mask & {BIT[name]} <> 0 THEN "
+        f"(SELECT (c.value #>> '{{}}')::{pg_type} FROM snapshot_attr_changes c "
+        f"WHERE c.device_id = {alias}.device_id AND c.attr = '{name}' "
+        f"AND c.changed_at <= {alias}.collected_at ORDER BY c.changed_at DESC LIMIT 1) "
+        f"ELSE {alias}.{name}::{pg_type} END"
+    )
+
+_FILL_SQL = text("""
+SELECT v.device_id, v.t, c.attr, c.value
+  FROM unnest(CAST(:d AS text[]), CAST(:t AS timestamp[])) AS v(device_id, t)
+ CROSS JOIN LATERAL (
+       SELECT DISTINCT ON (attr) attr, value
+         FROM snapshot_attr_changes
+        WHERE device_id = v.device_id AND attr = ANY(:a) AND changed_at <= v.t
+        ORDER BY attr, changed_at DESC) c
+""")
+
+def fill_masked(conn, snaps: Iterable[MetricSnapshot]) -> None:
+    """Put masked values back into loaded MetricSnapshot objects (one query for all of them)."""
+    masked = [s for s in snaps if s.deadband_mask]
+    if not masked:
+        return
+    attrs = sorted({n for s in masked for n, bit in BIT.items() if s.deadband_mask & bit})
+    rows = conn.execute(_FILL_SQL, {"d": [s.device_id for s in masked],
+                                    "t": [s.collected_at for s in masked], "a": attrs}).all()
+    values = {(r.device_id, r.t, r.attr): r.value for r in rows}
+    for s in masked:
+        for name, bit in BIT.items():
+            if s.deadband_mask & bit:
+                set_committed_value(s, name, _from_json(name, values.get((s.device_id, s.collected_at, name))))
+
+def prune(conn, cutoff: datetime) -> int:
+    """Drop log rows superseded before `cutoff` (retention keeps the last one per attr)."""
+    return conn.execute(text("""
+        DELETE FROM snapshot_attr_changes c
+         WHERE c.changed_at < :cutoff
+           AND EXISTS (SELECT 1 FROM snapshot_attr_changes n
+                        WHERE n.device_id = c.device_id AND n.attr = c.attr
+                          AND n.changed_at > c.changed_at AND n.changed_at <= :cutoff)
+    """), {"cutoff": cutoff}).rowcount
@@ -0,0 +1,108 @@
+# db/latest.py
+"""
+device_latest maintenance: one row per device pointing at its newest snapshot.
+
+Ingest calls upsert_latest() in the same transaction as the snapshot insert, so
+/devices reads O(devices) rows instead of grouping all of metric_snapshots.
+Every pointer that moves gets a new `seq`; ingest transactions take their seqs
+one at a time (advisory lock until commit), so seqs become visible in order and
+/devices/changes can page on them. That lock serializes every writer, so ingest
+calls upsert_latest() as its last statement before the ingest_stats bump and
+commit: only that tail is serialized, not the snapshot insert or the rollups.
+A NOTIFY on CHANGES_CHANNEL follows each batch.
+
+    python -m db.latest --check      # report pointers that disagree with history
+    python -m db.latest --rebuild    # recompute every pointer from metric_snapshots
+"""
+import argparse
+from typing import Dict, Iterable
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from db.models import DeviceLatest
+
+CHANGES_CHANNEL = "device_changes"
+_SEQ_LOCK_ID = 0x70616e6c   # held until commit while device_latest seqs are handed out
+
+def upsert_latest(conn, rows: Iterable[Dict]) -> None:
+    """rows: {device_id, snapshot_id, collected_at}; older-than-current rows are ignored."""
+    newest: Dict[str, Dict] = {}
+    for r in rows:
+        cur = newest.get(r["device_id"])
+        if cur is None or r["collected_at"] > cur["collected_at"]:
+            newest[r["device_id"]] = r
+    if not newest:
+        return
+    tbl = DeviceLatest.__table__
+    stmt = pg_insert(tbl).values(list(newest.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[tbl.c.device_id],
+        set_={"snapshot_id": stmt.excluded.snapshot_id, "collected_at": stmt.excluded.collected_at,
+              "seq": stmt.excluded.seq},
+        where=stmt.excluded.collected_at >= tbl.c.collected_at,
+    )
+    conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _SEQ_LOCK_ID})
+    conn.execute(stmt)
+    conn.execute(text("SELECT pg_notify(:ch, '')"), {"ch": CHANGES_CHANNEL})   # sent on commit
+
+_REBUILD_SQL = """
+INSERT INTO device_latest (device_id, snapshot_id, collected_at)
+SELECT DISTINCT ON (device_id) device_id, id, collected_at
+  FROM metric_snapshots
+ ORDER BY device_id, collected_at DESC, id DESC
+ON CONFLICT (device_id) DO UPDATE
+   SET snapshot_id = EXCLUDED.snapshot_id, collected_at = EXCLUDED.collected_at, seq = EXCLUDED.seq
+"""
+
+_CHECK_SQL = """
+SELECT coalesce(t.device_id, l.device_id) AS device_id,
+       l.collected_at AS pointer_ts, t.last_ts AS actual_ts
+  FROM (SELECT device_id, max(collected_at) AS last_ts
+          FROM metric_snapshots GROUP BY device_id) t
+  FULL JOIN device_latest l ON l.device_id = t.device_id
+ WHERE l.collected_at IS DISTINCT FROM t.last_ts
+    OR NOT EXISTS (SELECT 1 FROM metric_snapshots s
+                    WHERE s.id = l.snapshot_id AND s.device_id = l.device_id)
+"""
+
+def rebuild_latest(engine) -> int:
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _SEQ_LOCK_ID})
+        conn.execute(text(
+            "DELETE FROM device_latest l WHERE NOT EXISTS "
+            "(SELECT 1 FROM metric_snapshots s WHERE s.device_id = l.device_id)"
+        ))
+        return conn.execute(text(_REBUILD_SQL)).rowcount
+
+def check_latest(engine) -> list:
+    """Devices whose pointer is missing, stale or dangling (empty list = consistent)."""
+    with engine.connect() as conn:
+        return conn.execute(text(_CHECK_SQL)).all()
+
+def ensure_latest(engine) -> None:
+    """Populate device_latest on first start against a database that predates it."""
+    with engine.connect() as conn:
+        empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM device_latest)")).scalar()
+        has_history = conn.execute(text("SELECT EXISTS (SELECT 1 FROM metric_snapshots)")).scalar()
+    if empty and has_history:
+        rebuild_latest(engine)
+
+def main():
+    ap = argparse.ArgumentParser(description="Check or rebuild the device_latest table.")
+    ap.add_argument("--check", action="store_true",
+                    help="report pointers that disagree with history, exit 1 on drift (the default)")
+    ap.add_argument("--rebuild", action="store_true", help="recompute every pointer, then check")
+    args = ap.parse_args()
+
+    from db.database import engine
+    if args.rebuild:
+        print(f"[latest] rebuilt {rebuild_latest(engine)} pointers")
+    bad = check_latest(engine)
+    for r in bad:
+        print(f"[latest] {r.device_id}: pointer={r.pointer_ts} actual={r.actual_ts}")
+    print(f"[latest] {'consistent' if not bad else f'{len(bad)} inconsistent'}")
+    raise SystemExit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
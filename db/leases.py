@@ -0,0 +1,116 @@
+# db/leases.py
+"""
+Device leases for sharded collectors  (COLLECT_MODE=sharded, collector/shards.py)
+
+collector_leases holds one row per device from the last inventory. Each replica
+claims due devices with FOR UPDATE SKIP LOCKED, so concurrent claims never hand
+out the same row, and holds them for SHARD_LEASE_SECS while renewing in-flight
+ones. A device is due once its last collection is a full interval old and
+nobody holds a live lease on it:
+
+  • row committed       → last_collected_at = now, lease cleared
+  • visit / write failed → backoff(): lease cleared, device unclaimable for a while
+  • replica crashed     → lease runs out, another replica claims the device
+  • replica stopping    → release() hands its unfinished devices back at once
+
+All times come from the database clock (UTC), so replica clocks don't matter.
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import literal_column, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from db.models import CollectorLease
+
+_INVENTORY_LOCK_ID = 0x70616e69   # one replica refreshes the inventory at a time
+_NOW = "(now() AT TIME ZONE 'utc')"
+
+_CLAIM_SQL = text(f"""
+WITH due AS (
+    SELECT serial FROM collector_leases
+     WHERE (last_collected_at IS NULL OR last_collected_at <= {_NOW} - make_interval(secs => :interval))
+       AND (lease_until IS NULL OR lease_until < {_NOW})
+     ORDER BY last_collected_at NULLS FIRST, serial
+     LIMIT :n
+       FOR UPDATE SKIP LOCKED)
+UPDATE collector_leases l
+   SET owner = :owner, lease_until = {_NOW} + make_interval(secs => :lease)
+  FROM due
+ WHERE l.serial = due.serial
+RETURNING l.serial, l.device
+""")
+
+@contextmanager
+def inventory_lock(engine):
+    """Yield True if this replica got the inventory lock, False if another one holds it.
+
+    A session lock on an autocommit connection: it is held across the Panorama
+    calls without keeping a transaction open.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        got = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _INVENTORY_LOCK_ID}).scalar()
+        try:
+            yield got
+        finally:
+            if got:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _INVENTORY_LOCK_ID})
+
+def inventory_due(conn, interval: float) -> bool:
+    """True if the stored inventory is `interval` old (or empty)."""
+    return conn.execute(text(
+        f"SELECT coalesce(max(seen_at) <= {_NOW} - make_interval(secs => :i), true) FROM collector_leases"),
+        {"i": interval}).scalar()
+
+def sync_inventory(conn, devices: List[Dict], failed: Iterable[str] = ()) -> int:
+    """Upsert the inventory; drop devices it no longer lists (unless their Panorama failed)."""
+    rows = {d["serial"]: d for d in devices if d.get("serial")}
+    tbl = CollectorLease.__table__
+    if rows:
+        stmt = pg_insert(tbl).values([
+            {"serial": k, "panorama": d.get("panorama") or "", "device": d, "seen_at": literal_column(_NOW)}
+            for k, d in rows.items()])
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[tbl.c.serial],
+            set_={"panorama": stmt.excluded.panorama, "device": stmt.excluded.device,
+                  "seen_at": stmt.excluded.seen_at}))
+    # now() is the transaction start, so every row upserted above has seen_at = now
+    conn.execute(text(f"DELETE FROM collector_leases WHERE seen_at < {_NOW} AND panorama <> ALL(:f)"),
+                 {"f": list(failed)})
+    return len(rows)
+
+def claim(conn, owner: str, n: int, interval: float, lease: float) -> List[Dict]:
+    """Lease up to `n` due devices to `owner`; returns their inventory rows."""
+    if n <= 0:
+        return []
+    return [r.device for r in conn.execute(
+        _CLAIM_SQL, {"owner": owner, "n": n, "interval": interval, "lease": lease})]
+
+def renew(conn, owner: str, serials: List[str], lease: float) -> None:
+    if serials:
+        conn.execute(text(
+            f"UPDATE collector_leases SET lease_until = {_NOW} + make_interval(secs => :lease) "
+            "WHERE serial = ANY(:s) AND owner = :owner"), {"s": serials, "owner": owner, "lease": lease})
+
+def complete(conn, owner: str, serials: List[str]) -> int:
+    """Mark devices collected; returns how many `owner` still held (the rest passed to another replica)."""
+    if not serials:
+        return 0
+    return conn.execute(text(
+        f"UPDATE collector_leases SET last_collected_at = {_NOW}, owner = NULL, lease_until = NULL "
+        "WHERE serial = ANY(:s) AND owner = :owner"), {"s": serials, "owner": owner}).rowcount
+
+def backoff(conn, owner: str, serials: List[str], secs: float) -> int:
+    """Give `serials` back without marking them collected, but keep them unclaimable for `secs`."""
+    if not serials:
+        return 0
+    return conn.execute(text(
+        f"UPDATE collector_leases SET owner = NULL, lease_until = {_NOW} + make_interval(secs => :secs) "
+        "WHERE serial = ANY(:s) AND owner = :owner"), {"s": serials, "owner": owner, "secs": secs}).rowcount
+
+def release(conn, owner: str, serials: Optional[List[str]] = None) -> int:
+    """Give `owner`'s leases (or just `serials`) back without marking them collected."""
+    sql = "UPDATE collector_leases SET owner = NULL, lease_until = NULL WHERE owner = :owner"
+    if serials is not None:
+        sql += " AND serial = ANY(:s)"
+    return conn.execute(text(sql), {"owner": owner, "s": serials}).rowcount
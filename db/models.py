@@ -1,5 +1,6 @@
 # db/models.py
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, ForeignKey, UniqueConstraint, Index, Sequence
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from db.database import Base
 
@@ -8,15 +9,20 @@ class Device(Base):
     serial = Column(String(64), primary_key=True)
     hostname = Column(String(128), nullable=False, index=True)
     ip = Column(String(45))
-    panorama = Column(String(128))
+    panorama = Column(String(128), index=True)
     model = Column(String(64))
     pan_os_version = Column(String(64))
     snapshots = relationship("MetricSnapshot", back_populates="device", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_devices_hostname_serial", "hostname", "serial"),   # /devices keyset order
+    )
+
 class MetricSnapshot(Base):
     __tablename__ = "metric_snapshots"
+    # range-partitioned by month on collected_at (db/partitions.py), so it is part of the PK
     id = Column(Integer, primary_key=True, autoincrement=True)
-    collected_at = Column(DateTime, index=True, nullable=False)
+    collected_at = Column(DateTime, primary_key=True, index=True, nullable=False)
     device_id = Column(String(64), ForeignKey("devices.serial", ondelete="CASCADE"), nullable=False)
 
     connected = Column(String(16))
@@ -45,9 +51,81 @@ class MetricSnapshot(Base):
     disk_opt_pancfg_mgmt_ssl_private_pct = Column(Float)
     disk_opt_panraid_ld1_pct = Column(Float)
 
+    # any other collector keys (new mounts, future metrics) – no ALTER TABLE needed
+    extras = Column(JSONB(none_as_null=True))
+
+    # INGEST_DEADBAND: bits of fields stored as NULL because they didn't change (db/deadband.py)
+    deadband_mask = Column(Integer)
+
     device = relationship("Device", back_populates="snapshots")
 
     __table_args__ = (
         UniqueConstraint("device_id", "collected_at", name="uq_device_ts"),
         Index("ix_device_ts", "device_id", "collected_at"),
+        Index("ix_snap_extras", "extras", postgresql_using="gin", postgresql_ops={"extras": "jsonb_path_ops"}),
+        {"postgresql_partition_by": "RANGE (collected_at)"},
     )
+
+# bumped whenever a device's pointer moves; /devices/changes?since=<seq> reads past it
+device_latest_seq = Sequence("device_latest_seq", metadata=Base.metadata)
+
+class DeviceLatest(Base):
+    """Pointer to each device's newest snapshot; kept current by ingest (see db/latest.py)."""
+    __tablename__ = "device_latest"
+    device_id = Column(String(64), ForeignKey("devices.serial", ondelete="CASCADE"), primary_key=True)
+    snapshot_id = Column(Integer, nullable=False)
+    collected_at = Column(DateTime, nullable=False)
+    seq = Column(BigInteger, device_latest_seq, server_default=device_latest_seq.next_value(),
+                 nullable=False, index=True)
+
+class SnapshotAttrChange(Base):
+    """Value log for deadbanded snapshot fields: one row per change (see db/deadband.py)."""
+    __tablename__ = "snapshot_attr_changes"
+    device_id = Column(String(64), ForeignKey("devices.serial", ondelete="CASCADE"), primary_key=True)
+    attr = Column(String(64), primary_key=True)
+    changed_at = Column(DateTime, primary_key=True)   # collected_at of the snapshot that changed it
+    value = Column(JSONB, nullable=False)
+
+class MetricRollup(Base):
+    """Hourly / daily min-avg-max-p95 per device and metric; maintained by db/rollups.py."""
+    __tablename__ = "metric_rollups"
+    device_id = Column(String(64), ForeignKey("devices.serial", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(String(8), primary_key=True)   # "hour" | "day"
+    bucket = Column(DateTime, primary_key=True)        # bucket start, UTC
+    metric = Column(String(64), primary_key=True)
+    n = Column(Integer, nullable=False)
+    min = Column(Float)
+    avg = Column(Float)
+    max = Column(Float)
+    p95 = Column(Float)
+
+class IngestStats(Base):
+    """Single-row catalog of table sizes, kept current by ingest (see db/stats.py)."""
+    __tablename__ = "ingest_stats"
+    id = Column(Integer, primary_key=True)   # always 1
+    snapshot_rows = Column(BigInteger, nullable=False, default=0)
+    device_count = Column(Integer, nullable=False, default=0)
+    last_snapshot = Column(DateTime)
+    updated_at = Column(DateTime)
+    generation = Column(BigInteger, nullable=False, default=0, server_default="0")   # +1 per change
+
+class SweepStats(Base):
+    """Outcome of the last collector sweep per Panorama."""
+    __tablename__ = "sweep_stats"
+    panorama = Column(String(128), primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    duration_secs = Column(Float)
+    devices_seen = Column(Integer, nullable=False, default=0)
+    devices_failed = Column(Integer, nullable=False, default=0)
+    error = Column(String(512))   # inventory error, if Panorama itself failed
+
+class CollectorLease(Base):
+    """Work queue for sharded collectors: one row per inventoried device (see db/leases.py)."""
+    __tablename__ = "collector_leases"
+    serial = Column(String(64), primary_key=True)
+    panorama = Column(String(128), nullable=False, default="")
+    device = Column(JSONB, nullable=False)        # inventory row handed to collect()
+    seen_at = Column(DateTime, nullable=False)    # last inventory that listed it, UTC
+    owner = Column(String(128))                   # replica holding the lease
+    lease_until = Column(DateTime)
+    last_collected_at = Column(DateTime, index=True)
@@ -0,0 +1,188 @@
+# db/partitions.py
+"""
+Monthly range partitions for metric_snapshots (on collected_at) + retention.
+
+New databases get a partitioned metric_snapshots straight from the model.
+An existing plain table is converted once with `--migrate`: it is renamed to
+metric_snapshots_legacy and attached as the partition holding everything up
+to the end of the current month, so no rows are copied.
+
+    python -m db.partitions --migrate     # one-off conversion of a plain table
+    python -m db.partitions               # create upcoming partitions, apply retention
+
+RETENTION_MONTHS (0 = keep everything) drops – or, with RETENTION_ACTION=detach,
+detaches and keeps as a standalone archive table – partitions that ended more
+than that many months ago, after refreshing their rollups.
+"""
+import argparse, re, threading
+from datetime import date, datetime
+from os import getenv
+
+from sqlalchemy import text
+
+PARTITION_AHEAD_MONTHS  = int(getenv("PARTITION_AHEAD_MONTHS", "3"))
+RETENTION_MONTHS        = int(getenv("RETENTION_MONTHS", "0"))
+RETENTION_ACTION        = getenv("RETENTION_ACTION", "drop").lower()    # drop | detach
+PARTITION_MAINTAIN_SECS = float(getenv("PARTITION_MAINTAIN_SECS", str(6 * 3600)))
+
+_PARENT = "metric_snapshots"
+_LOCK_ID = 0x70616e6d   # advisory lock so only one worker maintains at a time
+_UPPER_RE = re.compile(r"TO \('([^']+)'\)")
+
+def _month(d: date, delta: int = 0) -> date:
+    m = d.month - 1 + delta
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:t)"), {"t": _PARENT}
+    ).scalar() or False
+
+def _partitions(conn) -> list[tuple[str, str]]:
+    """[(name, bound expression)] for every attached partition."""
+    return conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+          FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = to_regclass(:t)
+    """), {"t": _PARENT}).all()
+
+def ensure_partitions(conn, ahead: int = PARTITION_AHEAD_MONTHS) -> list[str]:
+    """Create the default partition and monthly ones through `ahead` months from now."""
+    if not is_partitioned(conn):
+        return []
+    existing = {name for name, _ in _partitions(conn)}
+    created = []
+    if f"{_PARENT}_default" not in existing:
+        conn.execute(text(f"CREATE TABLE {_PARENT}_default PARTITION OF {_PARENT} DEFAULT"))
+        created.append(f"{_PARENT}_default")
+    covered_until = max((datetime.fromisoformat(m.group(1)).date()
+                         for _, b in _partitions(conn) if (m := _UPPER_RE.search(b))), default=None)
+    this_month = _month(date.today())
+    for k in range(ahead + 1):
+        lo = _month(this_month, k)
+        name = f"{_PARENT}_p{lo:%Y%m}"
+        if name in existing or (covered_until and lo < covered_until):
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {_PARENT} "
+                    f"FOR VALUES FROM ('{lo}') TO ('{_month(lo, 1)}')"))
+            created.append(name)
+        except Exception as e:   # e.g. the default partition already holds rows for that month
+            print(f"[partitions] {name} not created – {e}")
+    return created
+
+def apply_retention(conn, months: int = RETENTION_MONTHS, action: str = RETENTION_ACTION) -> list[str]:
+    """Roll up, then drop/detach partitions whose range ended before the cutoff."""
+    if months <= 0 or not is_partitioned(conn):
+        return []
+    from db.rollups import refresh_rollups
+    from db.stats import bump
+    from db.deadband import prune
+    cutoff = _month(date.today(), -months)
+    done, upper = [], None
+    for name, bound in _partitions(conn):
+        m = _UPPER_RE.search(bound)
+        if not m or datetime.fromisoformat(m.group(1)).date() > cutoff:
+            continue
+        spans = conn.execute(text(
+            f"SELECT device_id, min(collected_at), max(collected_at) FROM {name} GROUP BY device_id"
+        )).all()
+        refresh_rollups(conn, {r[0]: (r[1], r[2]) for r in spans})
+        n = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        conn.execute(text(f"ALTER TABLE {_PARENT} DETACH PARTITION {name}"))
+        bump(conn, rows=-n)
+        if action == "detach":
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO archive_{name}"))
+        else:
+            conn.execute(text(f"DROP TABLE {name}"))
+        done.append(name)
+        upper = max(upper or m.group(1), m.group(1))
+    if done:
+        conn.execute(text(
+            "DELETE FROM device_latest l WHERE NOT EXISTS "
+            "(SELECT 1 FROM metric_snapshots s WHERE s.id = l.snapshot_id "
+            "AND s.collected_at = l.collected_at)"))
+        if action != "detach":   # archived partitions still read their values from the log
+            prune(conn, datetime.fromisoformat(upper))
+    return done
+
+def maintain(engine) -> None:
+    """ensure_partitions + apply_retention, by one process at a time."""
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _LOCK_ID}).scalar():
+            return
+        if not is_partitioned(conn):
+            print("[partitions] metric_snapshots is a plain table – run `python -m db.partitions --migrate`")
+            return
+        for name in ensure_partitions(conn):
+            print(f"[partitions] created {name}")
+        for name in apply_retention(conn):
+            print(f"[partitions] retention: {RETENTION_ACTION} {name}")
+
+def start_maintenance(engine) -> threading.Thread:
+    """Run maintain() now and then every PARTITION_MAINTAIN_SECS in a daemon thread."""
+    def _loop():
+        while True:
+            try:
+                maintain(engine)
+            except Exception as e:
+                print(f"[partitions] maintenance failed – {e}")
+            stop.wait(PARTITION_MAINTAIN_SECS)
+    stop = threading.Event()
+    t = threading.Thread(target=_loop, name="partition-maintenance", daemon=True)
+    t.start()
+    return t
+
+def migrate(engine) -> bool:
+    """Convert a plain metric_snapshots into a partitioned one, in place. Idempotent."""
+    from db.models import MetricSnapshot
+    from db.patches import ensure_columns
+    ensure_columns(engine)   # ATTACH needs the legacy table to have every model column
+    with engine.begin() as conn:
+        if is_partitioned(conn) or conn.execute(
+                text("SELECT to_regclass(:t) IS NULL"), {"t": _PARENT}).scalar():
+            return False
+        legacy = f"{_PARENT}_legacy"
+        conn.execute(text(f"LOCK TABLE {_PARENT} IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(f"ALTER TABLE {_PARENT} RENAME TO {legacy}"))
+        # free the names the partitioned parent is about to claim
+        for idx in conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": legacy}).scalars():
+            conn.execute(text(f'ALTER INDEX "{idx}" RENAME TO "{idx}_legacy"'))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {_PARENT}_id_seq RENAME TO {legacy}_id_seq"))
+        # the parent's PK is (id, collected_at) and its FK covers the partition once attached
+        for con in conn.execute(text(
+                "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t) "
+                "AND contype IN ('p', 'f')"), {"t": legacy}).scalars():
+            conn.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{con}"'))
+        MetricSnapshot.__table__.create(conn)
+        conn.execute(text(
+            f"SELECT setval('{_PARENT}_id_seq', greatest((SELECT max(id) FROM {legacy}), 1))"))
+        upper = _month(date.today(), 1)
+        conn.execute(text(
+            f"ALTER TABLE {_PARENT} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{upper}')"))
+        ensure_partitions(conn)
+    return True
+
+def main():
+    ap = argparse.ArgumentParser(description="Manage metric_snapshots partitions.")
+    ap.add_argument("--migrate", action="store_true",
+                    help="convert an existing plain metric_snapshots table first")
+    args = ap.parse_args()
+
+    from db.database import engine
+    if args.migrate:
+        print("[partitions] migrated" if migrate(engine) else "[partitions] nothing to migrate")
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            raise SystemExit("[partitions] metric_snapshots is not partitioned; run with --migrate")
+    maintain(engine)
+    with engine.connect() as conn:
+        for name, bound in sorted(_partitions(conn)):
+            print(f"  {name:40s} {bound}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,75 @@
 # db/patches.py
+"""
+Columns and indexes added to tables that predate them (create_all only creates
+missing tables). The catalog is checked first and only what is missing gets an
+ALTER / CREATE INDEX, so a normal startup takes no locks on the big tables.
+
+EXTRAS_INDEX_KEYS (comma-separated) adds a btree expression index on
+metric_snapshots.extras -> '<key>' for each extras key you filter on.
+"""
+import re
+from os import getenv
+
 from sqlalchemy import text
 
+EXTRAS_INDEX_KEYS = [k.strip() for k in getenv("EXTRAS_INDEX_KEYS", "").split(",") if k.strip()]
+
+# table -> {column: definition}
+_COLUMNS = {
+    "metric_snapshots": {
+        "disk_opt_pancfg_pct": "double precision",
+        "disk_opt_panrepo_pct": "double precision",
+        "disk_dev_shm_pct": "double precision",
+        "disk_cgroup_pct": "double precision",
+        "disk_opt_panlogs_pct": "double precision",
+        "disk_opt_pancfg_mgmt_ssl_private_pct": "double precision",
+        "disk_opt_panraid_ld1_pct": "double precision",
+        "extras": "jsonb",          # nullable, no default: a catalog-only change
+        "deadband_mask": "integer",
+    },
+    "device_latest": {
+        "seq": "bigint NOT NULL DEFAULT nextval('device_latest_seq')",
+    },
+    "ingest_stats": {
+        "generation": "bigint NOT NULL DEFAULT 0",
+    },
+}
+
+# index name -> (table, CREATE statement)
+_INDEXES = {
+    "ix_devices_panorama": ("devices", "CREATE INDEX ix_devices_panorama ON devices (panorama)"),
+    "ix_devices_hostname_serial": ("devices", "CREATE INDEX ix_devices_hostname_serial ON devices (hostname, serial)"),
+    "ix_device_latest_seq": ("device_latest", "CREATE INDEX ix_device_latest_seq ON device_latest (seq)"),
+    "ix_snap_extras": ("metric_snapshots",
+                       "CREATE INDEX ix_snap_extras ON metric_snapshots USING gin (extras jsonb_path_ops)"),
+}
+
+def _extras_index(key: str) -> tuple[str, tuple[str, str]]:
+    if not re.fullmatch(r"[A-Za-z0-9_]+", key):
+        raise ValueError(f"EXTRAS_INDEX_KEYS: bad key {key!r}")
+    name = f"ix_snap_extras_{key.lower()}"[:63]
+    return name, ("metric_snapshots", f"CREATE INDEX {name} ON metric_snapshots ((extras -> '{key}'))")
+
 def ensure_columns(engine) -> None:
-    # idempotent column adds (safe to run every startup)
-    sql = """
-    ALTER TABLE metric_snapshots
-      ADD COLUMN IF NOT EXISTS disk_opt_pancfg_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_opt_panrepo_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_dev_shm_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_cgroup_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_opt_panlogs_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_opt_pancfg_mgmt_ssl_private_pct double precision,
-      ADD COLUMN IF NOT EXISTS disk_opt_panraid_ld1_pct double precision;
-    """
+    """Add whatever columns / indexes are missing (safe to run every startup)."""
     with engine.begin() as conn:
-        conn.execute(text(sql))
\ No newline at end of file
+        have = set(conn.execute(text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ANY(:t)"),
+            {"t": list({*_COLUMNS, *(t for t, _ in _INDEXES.values())})}).all())
+        tables = {t for t, _ in have}
+        for table, cols in _COLUMNS.items():
+            if table not in tables:
+                continue
+            missing = [f"ADD COLUMN IF NOT EXISTS {c} {d}" for c, d in cols.items() if (table, c) not in have]
+            if missing:
+                conn.execute(text(f"ALTER TABLE {table} " + ", ".join(missing)))
+                print(f"[patches] {table}: added {len(missing)} column(s)")
+
+        indexes = dict(_INDEXES, **dict(map(_extras_index, EXTRAS_INDEX_KEYS)))
+        existing = set(conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")).scalars())
+        for name, (table, ddl) in indexes.items():
+            if name not in existing and table in tables:
+                conn.execute(text(ddl))
+                print(f"[patches] created index {name}")
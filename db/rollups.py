@@ -0,0 +1,114 @@
+# db/rollups.py
+"""
+Multi-resolution rollups for trend queries  →  metric_rollups
+
+Hourly buckets are computed from raw snapshots; daily buckets from the hourly
+ones (n-weighted avg, exact min/max, p95 = highest hourly p95, i.e. an upper
+bound). Ingest refreshes only the buckets its new rows fall into.
+
+    python -m db.rollups --backfill [--days N]   # rebuild from existing history
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import text
+
+from db.deadband import filled_sql
+
+ROLLUP_METRICS = (
+    "cpu_one_min", "memory_usage", "session_count",
+    "disk_root_pct", "disk_dev_pct", "disk_opt_pancfg_pct", "disk_opt_panrepo_pct",
+    "disk_dev_shm_pct", "disk_cgroup_pct", "disk_opt_panlogs_pct",
+    "disk_opt_pancfg_mgmt_ssl_private_pct", "disk_opt_panraid_ld1_pct",
+)
+RESOLUTIONS = ("hour", "day")
+
+# deadbanded values are read back from the change log (db/deadband.py)
+_VALUES = ", ".join(f"('{m}', {filled_sql(m)})" for m in ROLLUP_METRICS)
+
+_SPANS = """
+unnest(CAST(:ids AS text[]), CAST(:los AS timestamp[]), CAST(:his AS timestamp[]))
+    AS sp(device_id, lo, hi)
+"""
+
+_UPSERT = """
+ON CONFLICT (device_id, resolution, bucket, metric) DO UPDATE
+   SET n = EXCLUDED.n, min = EXCLUDED.min, avg = EXCLUDED.avg,
+       max = EXCLUDED.max, p95 = EXCLUDED.p95
+"""
+
+_HOURLY_SQL = f"""
+INSERT INTO metric_rollups (device_id, resolution, bucket, metric, n, min, avg, max, p95)
+SELECT s.device_id, 'hour', date_trunc('hour', s.collected_at), m.metric,
+       count(*), min(m.v), avg(m.v), max(m.v),
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY m.v)
+  FROM {_SPANS}
+  JOIN metric_snapshots s
+    ON s.device_id = sp.device_id
+   AND s.collected_at >= date_trunc('hour', sp.lo)
+   AND s.collected_at <  date_trunc('hour', sp.hi) + interval '1 hour'
+ CROSS JOIN LATERAL (VALUES {_VALUES}) AS m(metric, v)
+ WHERE m.v IS NOT NULL
+ GROUP BY 1, 3, 4
+{_UPSERT}
+"""
+
+_DAILY_SQL = f"""
+INSERT INTO metric_rollups (device_id, resolution, bucket, metric, n, min, avg, max, p95)
+SELECT r.device_id, 'day', date_trunc('day', r.bucket), r.metric,
+       sum(r.n), min(r.min), sum(r.avg * r.n) / sum(r.n), max(r.max), max(r.p95)
+  FROM {_SPANS}
+  JOIN metric_rollups r
+    ON r.device_id = sp.device_id
+   AND r.resolution = 'hour'
+   AND r.bucket >= date_trunc('day', sp.lo)
+   AND r.bucket <  date_trunc('day', sp.hi) + interval '1 day'
+ GROUP BY 1, 3, 4
+{_UPSERT}
+"""
+
+def spans_of(rows: Iterable[Tuple[str, datetime]]) -> Dict[str, Tuple[datetime, datetime]]:
+    """(device_id, collected_at) pairs → device_id: (earliest, latest)."""
+    out: Dict[str, Tuple[datetime, datetime]] = {}
+    for dev, ts in rows:
+        lo, hi = out.get(dev, (ts, ts))
+        out[dev] = (min(lo, ts), max(hi, ts))
+    return out
+
+def refresh_rollups(conn, spans: Dict[str, Tuple[datetime, datetime]]) -> None:
+    """Recompute every hourly and daily bucket touched by `spans` (naive UTC timestamps)."""
+    if not spans:
+        return
+    params = {
+        "ids": list(spans),
+        "los": [lo for lo, _ in spans.values()],
+        "his": [hi for _, hi in spans.values()],
+    }
+    conn.execute(text(_HOURLY_SQL), params)
+    conn.execute(text(_DAILY_SQL), params)
+
+def backfill(engine, days: int | None = None) -> int:
+    """Rebuild rollups from raw history (optionally only the last `days`)."""
+    where = "WHERE collected_at >= :since" if days else ""
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days) if days else None
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            f"SELECT device_id, min(collected_at), max(collected_at) "
+            f"FROM metric_snapshots {where} GROUP BY device_id"), {"since": since}).all()
+        refresh_rollups(conn, {r[0]: (r[1], r[2]) for r in rows})
+    return len(rows)
+
+def main():
+    ap = argparse.ArgumentParser(description="Maintain metric_rollups.")
+    ap.add_argument("--backfill", action="store_true", help="rebuild rollups from raw snapshots")
+    ap.add_argument("--days", type=int, default=None, help="only the most recent N days")
+    args = ap.parse_args()
+    if not args.backfill:
+        ap.error("nothing to do (use --backfill)")
+
+    from db.database import engine
+    print(f"[rollups] refreshed {backfill(engine, args.days)} devices")
+
+if __name__ == "__main__":
+    main()
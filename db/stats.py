@@ -0,0 +1,118 @@
+# db/stats.py
+"""
+Stats catalog: what /health reports, without counting the history tables.
+
+ingest_stats is a single row (snapshot rows, devices, newest snapshot) that
+ingest bumps in the same transaction as its inserts and retention decrements
+when it drops a partition. Every change also increments `generation`, the
+counter the API response cache is keyed on. sweep_stats holds the last collector sweep per
+Panorama. /health?exact=true still runs the full counts.
+
+    python -m db.stats              # compare the catalog with exact counts
+    python -m db.stats --refresh    # overwrite the catalog with exact counts
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from db.models import SweepStats
+
+_EXACT_SQL = text("""
+SELECT (SELECT count(*) FROM metric_snapshots)      AS snapshot_rows,
+       (SELECT count(*) FROM devices)               AS device_count,
+       (SELECT max(collected_at) FROM metric_snapshots) AS last_snapshot
+""")
+
+_BUMP_SQL = text("""
+UPDATE ingest_stats
+   SET snapshot_rows = snapshot_rows + :rows,
+       device_count  = device_count + :devices,
+       last_snapshot = greatest(last_snapshot, :last),
+       updated_at    = now() AT TIME ZONE 'utc',
+       generation    = generation + 1
+ WHERE id = 1
+""")
+
+_REFRESH_SQL = text("""
+INSERT INTO ingest_stats (id, snapshot_rows, device_count, last_snapshot, updated_at)
+VALUES (1, :snapshot_rows, :device_count, :last_snapshot, now() AT TIME ZONE 'utc')
+ON CONFLICT (id) DO UPDATE
+   SET snapshot_rows = EXCLUDED.snapshot_rows, device_count = EXCLUDED.device_count,
+       last_snapshot = EXCLUDED.last_snapshot, updated_at = EXCLUDED.updated_at,
+       generation = ingest_stats.generation + 1
+""")
+
+def _naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def bump(conn, rows: int = 0, devices: int = 0, last: Optional[datetime] = None) -> None:
+    """Add to the counters; call inside the transaction that did the inserts/deletes."""
+    if rows or devices or last is not None:
+        conn.execute(_BUMP_SQL, {"rows": rows, "devices": devices, "last": _naive_utc(last)})
+
+def exact_stats(conn) -> Dict:
+    return dict(conn.execute(_EXACT_SQL).one()._mapping)
+
+def refresh_stats(conn) -> Dict:
+    """Recount everything and store it (sequential scans – not for the request path)."""
+    exact = exact_stats(conn)
+    conn.execute(_REFRESH_SQL, exact)
+    return exact
+
+def read_stats(conn) -> Optional[Dict]:
+    row = conn.execute(text(
+        "SELECT snapshot_rows, device_count, last_snapshot, updated_at FROM ingest_stats WHERE id = 1"
+    )).one_or_none()
+    return dict(row._mapping) if row else None
+
+def record_sweeps(conn, started: datetime, sweeps: Iterable[Dict]) -> None:
+    """sweeps: {panorama, duration_secs, devices_seen, devices_failed, error}."""
+    rows = [{"started_at": _naive_utc(started), **s} for s in sweeps]
+    if not rows:
+        return
+    tbl = SweepStats.__table__
+    stmt = pg_insert(tbl).values(rows)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[tbl.c.panorama],
+        set_={c: stmt.excluded[c] for c in
+              ("started_at", "duration_secs", "devices_seen", "devices_failed", "error")},
+    ))
+    # let response caches keyed on the catalog see the new sweep
+    conn.execute(text("UPDATE ingest_stats SET updated_at = now() AT TIME ZONE 'utc', "
+                      "generation = generation + 1 WHERE id = 1"))
+
+def read_sweeps(conn) -> list[Dict]:
+    return [dict(r._mapping) for r in conn.execute(text(
+        "SELECT panorama, started_at, duration_secs, devices_seen, devices_failed, error "
+        "FROM sweep_stats ORDER BY panorama"))]
+
+def ensure_stats(engine) -> None:
+    """Fill the catalog on first start against a database that predates it."""
+    with engine.begin() as conn:
+        if read_stats(conn) is None:
+            refresh_stats(conn)
+
+def main():
+    ap = argparse.ArgumentParser(description="Check or refresh the ingest_stats catalog.")
+    ap.add_argument("--refresh", action="store_true", help="overwrite it with exact counts")
+    args = ap.parse_args()
+
+    from db.database import engine
+    with engine.begin() as conn:
+        cat = read_stats(conn) or {}
+        exact = refresh_stats(conn) if args.refresh else exact_stats(conn)
+    drift = {k: (cat.get(k), v) for k, v in exact.items() if cat.get(k) != v}
+    for k, (was, actual) in drift.items():
+        print(f"[stats] {k}: catalog={was} actual={actual}")
+    if args.refresh:
+        print("[stats] refreshed")
+    print(f"[stats] {'consistent' if not drift else f'{len(drift)} field(s) drifted'}")
+    raise SystemExit(1 if drift and not args.refresh else 0)
+
+if __name__ == "__main__":
+    main()
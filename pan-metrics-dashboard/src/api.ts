@@ -32,3 +32,8 @@ export async function fetchJSON<T>(path: string): Promise<T> {
   }
   return res.json() as Promise<T>;
 }
+
+/** Absolute URL for things fetch() doesn't cover, e.g. an EventSource. */
+export function apiURL(path: string): string {
+  return join(API_BASE, path);
+}
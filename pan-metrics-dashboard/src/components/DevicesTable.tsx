@@ -1,15 +1,19 @@
-import { useQuery } from "@tanstack/react-query";
+import { useEffect, useMemo } from "react";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import {
   useReactTable,
   getCoreRowModel,
   flexRender,
   type ColumnDef,
 } from "@tanstack/react-table";
-import { fetchJSON } from "../api";
+import { apiURL, fetchJSON } from "../api";
 
 /** We render whatever keys the API returns (base + extras). */
 type Device = Record<string, unknown>;
 
+/** /devices/changes and /devices/stream payload */
+type Changes = { watermark: number; devices: Device[] };
+
 /* ────── thresholds (tweak if you like) ────── */
 const CERT_YELLOW_DAYS = 60;
 const CERT_RED_DAYS = 30;
@@ -272,13 +276,47 @@ function renderValue(key: string, value: unknown, row: Device) {
   return String(value);
 }
 
+/** Replace changed devices (by serial) and add new ones. */
+function mergeChanges(rows: Device[], changed: Device[]): Device[] {
+  const bySerial = new Map(rows.map((r) => [String(r.serial), r]));
+  for (const d of changed) bySerial.set(String(d.serial), d);
+  return Array.from(bySerial.values());
+}
+
 /* ────── React component ────── */
 export default function DevicesTable() {
-  const { data = [], isLoading } = useQuery<Device[]>({
+  const qc = useQueryClient();
+  // one full load, then deltas pushed over SSE; the slow refetch is only a safety net
+  const { data: snapshot, isLoading } = useQuery<Changes>({
     queryKey: ["devices"],
-    queryFn: () => fetchJSON<Device[]>("/devices"),
-    refetchInterval: 60_000,
+    queryFn: () => fetchJSON<Changes>("/devices/changes?since=0"),
+    refetchInterval: 10 * 60_000,
   });
+  const loaded = snapshot != null;
+
+  useEffect(() => {
+    if (!loaded) return;
+    const since = qc.getQueryData<Changes>(["devices"])?.watermark ?? 0;
+    // EventSource reconnects by itself and resumes from the last event id
+    const es = new EventSource(apiURL(`/devices/stream?since=${since}`));
+    es.addEventListener("changes", (ev) => {
+      const msg = JSON.parse((ev as MessageEvent<string>).data) as Changes;
+      qc.setQueryData<Changes>(["devices"], (old) =>
+        old && msg.watermark > old.watermark
+          ? { watermark: msg.watermark, devices: mergeChanges(old.devices, msg.devices) }
+          : old,
+      );
+    });
+    return () => es.close();
+  }, [loaded, qc]);
+
+  const data = useMemo(
+    () =>
+      [...(snapshot?.devices ?? [])].sort((a, b) =>
+        String(a.hostname ?? "").localeCompare(String(b.hostname ?? "")),
+      ),
+    [snapshot],
+  );
 
   // Compute the union of keys across all rows
   const allKeys = Array.from(new Set(data.flatMap((r) => Object.keys(r ?? {}))));